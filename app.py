@@ -1,19 +1,36 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_from_directory, Response, session, g, stream_with_context
+import json
 import requests
 import sqlite3
 import os
 from datetime import datetime
 import logging
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from werkzeug.datastructures import FileStorage
+from requests.adapters import HTTPAdapter
 import uuid
 import re
-from collections import Counter
+import hashlib
+import click
+import random
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from task_queue import TaskQueue
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Pillow 为可选依赖：未安装时不生成缩略图，列表接口直接返回原图
+try:
+    from PIL import Image, ImageOps, features as pil_features
+except ImportError:
+    Image = None
+    logger.warning("Pillow is not installed, thumbnails are disabled")
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
 
@@ -27,9 +44,172 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 # 确保上传目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# 缩略图配置：存放在原图所在目录的 _thumbs 子目录中，如 cats/Tom/_thumbs/<id>.320.webp
+THUMBNAIL_WIDTHS = (320, 640, 960)
+THUMBNAIL_DEFAULT_WIDTH = 320
+THUMBNAIL_DIR = '_thumbs'
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_FORMAT = 'webp' if Image is not None and pil_features.check('webp') else 'jpeg'
+
 # 数据库配置
 SOURCE_DATABASE = 'cats.db'
 FAVRITE_DATABASE = 'favcats.db'
+DB_BUSY_TIMEOUT = 5  # 等待写锁的时间（秒）
+DB_CACHE_SIZE_KB = 16 * 1024  # 每个连接的页缓存大小
+DB_CACHED_STATEMENTS = 256  # 每个连接缓存的预编译语句数
+DB_POOL_MAX_IDLE = 8  # 每个数据库最多保留的空闲连接数
+TASK_DATABASE = 'tasks.db'  # 后台任务队列
+HASH_CHUNK_SIZE = 1024 * 1024  # 边写入边计算内容哈希时每次读取的字节数
+TASK_WORKERS = 2
+
+# 识别服务器配置（可通过环境变量覆盖地址）
+app.config['RECOGNITION_SERVER_URL'] = os.environ.get('RECOGNITION_SERVER_URL', 'http://localhost:2255')
+app.config['RECOGNITION_CONNECT_TIMEOUT'] = 3  # 建立连接超时（秒）
+app.config['RECOGNITION_READ_TIMEOUT'] = 35  # 等待识别结果超时（秒），比识别服务器的 RECOGNITION_TIMEOUT (30 秒) 多留几秒
+app.config['RECOGNITION_RETRIES'] = 2  # 连接被重置/拒绝时的重试次数
+app.config['RECOGNITION_RETRY_BACKOFF'] = 0.2  # 重试退避基数（秒），每次翻倍
+app.config['RECOGNITION_BREAKER_FAILURES'] = 5  # 统计窗口内失败达到该次数后熔断
+app.config['RECOGNITION_BREAKER_WINDOW'] = 60  # 失败统计窗口（秒）
+app.config['RECOGNITION_BREAKER_COOLDOWN'] = 15  # 熔断后多久开始用 /health 探测恢复（秒）
+
+# 识别并发配置：所有请求共享一个线程池，单个请求最多同时占用 RECOGNITION_MAX_CONCURRENCY 个线程
+RECOGNITION_POOL_SIZE = 16
+RECOGNITION_MAX_CONCURRENCY = 8
+RECOGNITION_BATCH_SIZE = 16  # 每个 /recognize_batch 请求携带的图片数
+RECOGNITION_JOB_TTL = 600  # 异步识别任务完成后保留结果的时间（秒）
+recognition_executor = ThreadPoolExecutor(max_workers=RECOGNITION_POOL_SIZE, thread_name_prefix='recognize')
+
+
+def create_recognition_session(pool_size):
+    """创建到识别服务器的长连接会话，连接池大小与识别线程池一致，可在线程间共享。"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+recognition_session = create_recognition_session(RECOGNITION_POOL_SIZE)
+
+
+class RecognitionServerUnavailable(Exception):
+    """熔断器处于打开状态，识别请求被直接拒绝。"""
+
+
+class CircuitBreaker:
+    """
+    识别服务的熔断器。
+    closed: 正常放行，统计窗口内的失败（连接错误、超时、502/503/504）；失败过多则进入 open。
+    open: 直接拒绝请求；冷却时间过后由一个线程调用 probe（/health）探测，成功则进入 half_open。
+    half_open: 只放行一个试探请求，成功则恢复 closed，失败则重新 open。
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, probe, failure_threshold=5, window=60, cooldown=15):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.recent_failures = deque()
+        self.counters = {'calls': 0, 'successes': 0, 'failures': 0, 'rejected': 0,
+                         'probes': 0, 'probe_failures': 0, 'opened': 0}
+        self._probing = False
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _open(self, now):
+        if self.state != self.OPEN:
+            self.counters['opened'] += 1
+            logger.warning("AI识别服务熔断器已打开，后续请求将快速失败。")
+        self.state = self.OPEN
+        self.opened_at = now
+        self._trial_in_flight = False
+
+    def allow_request(self):
+        """判断是否放行一次请求；open 状态冷却结束后在此处同步探测 /health。"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.CLOSED:
+                self.counters['calls'] += 1
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                self.counters['calls'] += 1
+                return True
+            if self.state == self.HALF_OPEN or self._probing or now - self.opened_at < self.cooldown:
+                self.counters['rejected'] += 1
+                return False
+            self._probing = True
+            self.counters['probes'] += 1
+
+        healthy = False
+        try:
+            healthy = self.probe()
+        except Exception as e:
+            logger.warning(f"AI识别服务健康探测失败: {e}")
+
+        with self._lock:
+            self._probing = False
+            if not healthy:
+                self.counters['probe_failures'] += 1
+                self.counters['rejected'] += 1
+                self.opened_at = time.monotonic()
+                return False
+            logger.info("AI识别服务健康探测成功，熔断器进入半开状态。")
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = True
+            self.counters['calls'] += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.counters['successes'] += 1
+            if self.state == self.HALF_OPEN:
+                logger.info("AI识别服务已恢复，熔断器关闭。")
+                self.state = self.CLOSED
+                self.opened_at = None
+                self.recent_failures.clear()
+                self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self.counters['failures'] += 1
+            if self.state == self.HALF_OPEN:
+                self._open(now)
+                return
+            self.recent_failures.append(now)
+            while self.recent_failures and now - self.recent_failures[0] > self.window:
+                self.recent_failures.popleft()
+            if self.state == self.CLOSED and len(self.recent_failures) >= self.failure_threshold:
+                self._open(now)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'recent_failures': len(self.recent_failures),
+                'failure_threshold': self.failure_threshold,
+                'seconds_since_open': round(time.monotonic() - self.opened_at, 1) if self.opened_at else None,
+                'counters': dict(self.counters),
+            }
+
+
+def probe_recognition_server():
+    """熔断器的恢复探测：请求识别服务器的 /health。"""
+    url = app.config['RECOGNITION_SERVER_URL'].rstrip('/') + '/health'
+    response = recognition_session.get(url, timeout=(app.config['RECOGNITION_CONNECT_TIMEOUT'], 2))
+    return response.status_code == 200
+
+
+recognition_breaker = CircuitBreaker(
+    probe_recognition_server,
+    failure_threshold=app.config['RECOGNITION_BREAKER_FAILURES'],
+    window=app.config['RECOGNITION_BREAKER_WINDOW'],
+    cooldown=app.config['RECOGNITION_BREAKER_COOLDOWN'],
+)
 
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
@@ -54,68 +234,497 @@ def normalize_path(path):
     """将路径标准化为使用正斜杠"""
     return path.replace('\\', '/')
 
-def init_db():
-    """初始化数据库"""
-    # 初始化收藏数据库
-    conn = sqlite3.connect(FAVRITE_DATABASE)
-    conn.execute('''
+def image_url_to_file_path(image_url):
+    """把图片 URL（/cats/...）转换为收藏数据库中存储的文件路径"""
+    # 从URL中提取文件路径
+    if image_url.startswith('/cats/'):
+        relative_path = image_url[6:]  # 移除 '/cats/' 前缀
+        file_path = f"cats/{relative_path}"
+    else:
+        file_path = image_url
+    
+    # 标准化路径分隔符为正斜杠（用于数据库存储）
+    return normalize_path(file_path)
+
+def write_stream_hashed(chunks, os_file_path):
+    """把数据块写入 os_file_path 旁的临时文件，同时计算 SHA-256
+
+    返回 (临时文件路径, 十六进制摘要)；调用方确认不是重复图片后再 os.replace 到正式路径。
+    """
+    tmp_path = f"{os_file_path}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest()
+
+def hash_file(os_file_path):
+    """计算已有文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(os_file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def find_cat_by_hash(conn, content_hash, name=None):
+    """按内容哈希查找已入库的图片；给出 name 时只查找同名的记录，不存在时返回 None"""
+    if name is None:
+        return conn.execute(
+            'SELECT id, name, file_path FROM cats WHERE content_hash = ? ORDER BY id LIMIT 1',
+            (content_hash,)
+        ).fetchone()
+    return conn.execute(
+        'SELECT id, name, file_path FROM cats WHERE content_hash = ? AND name = ? ORDER BY id LIMIT 1',
+        (content_hash, name)
+    ).fetchone()
+
+def upload_os_path(file_path):
+    """把数据库中的 cats/... 路径解析为 UPLOAD_FOLDER 下的文件路径，不在其中时返回 None"""
+    file_path = normalize_path(file_path)
+    if not file_path.startswith('cats/'):
+        return None
+    os_file_path = safe_join(UPLOAD_FOLDER, file_path[len('cats/'):])
+    if os_file_path is None:
+        return None
+    # 符号链接也不能指向 UPLOAD_FOLDER 之外
+    real_root = os.path.realpath(UPLOAD_FOLDER)
+    if os.path.commonpath([real_root, os.path.realpath(os_file_path)]) != real_root:
+        return None
+    return os_file_path
+
+def open_database(path):
+    """打开 SQLite 连接：WAL 模式、synchronous=NORMAL、忙等待超时、较大的页缓存"""
+    conn = sqlite3.connect(
+        path,
+        timeout=DB_BUSY_TIMEOUT,
+        cached_statements=DB_CACHED_STATEMENTS,
+        check_same_thread=False  # 连接在线程间通过连接池传递，同一时刻只被一个请求使用
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT * 1000}')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+    return conn
+
+class ConnectionPool:
+    """复用 SQLite 连接的简单连接池
+
+    每个请求（应用上下文）借出一个连接，请求结束时归还；空闲连接超过 max_idle 时直接关闭。
+    """
+
+    def __init__(self, path, max_idle=DB_POOL_MAX_IDLE):
+        self.path = path
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.idle = []
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return open_database(self.path)
+
+    def release(self, conn):
+        # 回滚请求中未提交的事务，避免把锁带给下一个使用者
+        if conn.in_transaction:
+            conn.rollback()
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+favorite_db_pool = ConnectionPool(FAVRITE_DATABASE)
+source_db_pool = ConnectionPool(SOURCE_DATABASE)
+
+def run_migrations(conn, migrations):
+    """按 PRAGMA user_version 依次执行尚未应用的迁移步骤
+
+    migrations 为 (版本号, 说明, SQL 脚本) 列表，版本号从 1 递增。
+    每一步与 user_version 的更新在同一个事务中完成，失败时整步回滚；
+    步骤本身也应写成可重复执行的（IF NOT EXISTS 等）。
+    """
+    current = conn.execute('PRAGMA user_version').fetchone()[0]
+    for version, description, script in migrations:
+        if version <= current:
+            continue
+        conn.execute('BEGIN')
+        try:
+            for statement in script.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            logger.error(f"Migration {version} ({description}) failed")
+            raise
+        logger.info(f"Applied migration {version}: {description}")
+        current = version
+
+# 收藏数据库的结构迁移，新增结构变化时在末尾追加一步
+FAVORITE_MIGRATIONS = [
+    (1, 'create cats table', '''
         CREATE TABLE IF NOT EXISTS cats (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             file_path TEXT NOT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
-    conn.commit()
-    conn.close()
+    '''),
+    (2, 'unique index on file_path', '''
+        DELETE FROM cats WHERE id NOT IN (SELECT MIN(id) FROM cats GROUP BY file_path);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_cats_file_path ON cats (file_path)
+    '''),
+]
+
+def thumbnail_relative_path(relative_path, width):
+    """原图相对路径（cats/ 之下）对应的缩略图相对路径，保留原扩展名以免 a.jpg 和 a.png 冲突"""
+    directory, filename = os.path.split(relative_path)
+    return '/'.join(filter(None, [directory, THUMBNAIL_DIR, f"{filename}.{width}.{THUMBNAIL_FORMAT}"]))
+
+def generate_thumbnail(relative_path, width):
+    """生成一张缩略图（不放大），已存在时直接返回；返回缩略图相对路径，失败返回 None"""
+    source = safe_join(UPLOAD_FOLDER, relative_path)
+    thumb_relative = thumbnail_relative_path(relative_path, width)
+    target = safe_join(UPLOAD_FOLDER, thumb_relative)
+    if Image is None or source is None or target is None or not os.path.isfile(source):
+        return None
+    if os.path.exists(target):
+        return thumb_relative
     
-    # 初始化源数据库
-    conn = sqlite3.connect(SOURCE_DATABASE)
-    conn.execute('''
+    try:
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+            img = img.convert('RGBA' if has_alpha and THUMBNAIL_FORMAT == 'webp' else 'RGB')
+            if img.width > width:
+                img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+            
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # 先写临时文件再改名，避免并发请求读到写了一半的缩略图
+            tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+            img.save(tmp_path, format=THUMBNAIL_FORMAT.upper(), quality=THUMBNAIL_QUALITY)
+            os.replace(tmp_path, target)
+        return thumb_relative
+    except Exception as e:
+        logger.error(f"Failed to create {width}px thumbnail for {relative_path}: {e}")
+        return None
+
+def generate_thumbnails(relative_path):
+    """为一张原图生成所有尺寸的缩略图，返回成功生成的数量"""
+    if Image is None:
+        return 0
+    return sum(1 for width in THUMBNAIL_WIDTHS if generate_thumbnail(relative_path, width))
+
+def thumbnail_fields(relative_path):
+    """列表接口中每张图片附带的缩略图字段；未安装 Pillow 时指向原图"""
+    if Image is None:
+        return {'thumb_url': f"/cats/{relative_path}", 'srcset': ''}
+    return {
+        'thumb_url': f"/thumbs/{THUMBNAIL_DEFAULT_WIDTH}/{relative_path}",
+        'srcset': ', '.join(f"/thumbs/{width}/{relative_path} {width}w" for width in THUMBNAIL_WIDTHS)
+    }
+
+# 上传/导入之后的图片处理在后台任务队列中执行，不占用请求时间
+task_queue = TaskQueue(TASK_DATABASE, workers=TASK_WORKERS)
+
+def post_process_image(payload):
+    """后台任务：图片入库后的后续处理（目前为生成缩略图），可重复执行"""
+    relative_path = payload['relative_path']
+    source = safe_join(UPLOAD_FOLDER, relative_path)
+    if source is None or not os.path.isfile(source):
+        logger.warning(f"Skipping post-processing, image no longer exists: {relative_path}")
+        return
+    if Image is not None and generate_thumbnails(relative_path) < len(THUMBNAIL_WIDTHS):
+        # 抛出异常让任务队列稍后重试
+        raise RuntimeError(f"Thumbnail generation incomplete for {relative_path}")
+
+task_queue.register('post_process_image', post_process_image)
+
+def enqueue_post_processing(relative_path):
+    """为 cats/ 下的一张图片排入后续处理任务，返回任务 id"""
+    task_queue.start()  # 已启动时不做任何事
+    return task_queue.enqueue(
+        'post_process_image',
+        {'relative_path': relative_path},
+        dedupe_key=f"post_process_image:{relative_path}"
+    )
+
+# 源数据库的结构迁移，新增结构变化时在末尾追加一步
+SOURCE_MIGRATIONS = [
+    (1, 'create cats table', '''
         CREATE TABLE IF NOT EXISTS cats (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
             file_path TEXT NOT NULL UNIQUE,
             time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
+    '''),
+    # 按时间倒序分页（/api/source_cats）使用的索引
+    (2, 'index on (time, id)', '''
+        CREATE INDEX IF NOT EXISTS idx_cats_time_id ON cats (time, id)
+    '''),
+    # 图片内容的 SHA-256，用于上传/导入去重；已有数据由 flask dedupe-cats 补全
+    (3, 'content_hash column', '''
+        ALTER TABLE cats ADD COLUMN content_hash TEXT;
+        CREATE INDEX IF NOT EXISTS idx_cats_content_hash ON cats (content_hash)
+    '''),
+    # 内容相同、名字不同的图片共用一个文件：file_path 不再唯一，改为 (name, file_path) 唯一。
+    # 重建表会删除全文索引的触发器，init_search_index 随后会重新创建；id 不变，全文索引无需重建
+    (4, 'allow several names per image file', '''
+        CREATE TABLE cats_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            content_hash TEXT
+        );
+        INSERT INTO cats_new (id, name, file_path, time, content_hash)
+            SELECT id, name, file_path, time, content_hash FROM cats;
+        DROP TABLE cats;
+        ALTER TABLE cats_new RENAME TO cats;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_cats_name_file_path ON cats (name, file_path);
+        CREATE INDEX IF NOT EXISTS idx_cats_file_path ON cats (file_path);
+        CREATE INDEX IF NOT EXISTS idx_cats_time_id ON cats (time, id);
+        CREATE INDEX IF NOT EXISTS idx_cats_content_hash ON cats (content_hash)
+    '''),
+]
+
+def init_db():
+    """初始化数据库"""
+    # 初始化收藏数据库
+    conn = open_database(FAVRITE_DATABASE)
+    run_migrations(conn, FAVORITE_MIGRATIONS)
+    conn.close()
+    
+    # 初始化源数据库
+    conn = open_database(SOURCE_DATABASE)
+    run_migrations(conn, SOURCE_MIGRATIONS)
+    init_search_index(conn)
     conn.commit()
     conn.close()
 
+# 名字全文索引是否可用（SQLite 未编译 FTS5 时退回 LIKE 查询）
+SEARCH_FTS_ENABLED = None  # None 表示尚未检查，见 search_fts_enabled
+SEARCH_FTS_OBJECTS = ('cats_fts', 'cats_fts_insert', 'cats_fts_delete', 'cats_fts_update')
+SEARCH_MIN_TRIGRAM_LENGTH = 3  # trigram 索引只能匹配至少 3 个字符的查询
+
+def init_search_index(conn):
+    """创建 cats.name 的 FTS5 trigram 索引，并用触发器与 cats 表保持同步
+
+    所有写入 cats 的路径（上传、添加、从 API 导入）都会经过触发器，无需各自维护索引。
+    """
+    global SEARCH_FTS_ENABLED
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cats_fts'"
+    ).fetchone()
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS cats_fts USING fts5(
+                name, content='cats', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        logger.warning(f"FTS5 trigram index unavailable, search falls back to LIKE: {e}")
+        SEARCH_FTS_ENABLED = False
+        return
+    
+    conn.executescript('''
+        CREATE TRIGGER IF NOT EXISTS cats_fts_insert AFTER INSERT ON cats BEGIN
+            INSERT INTO cats_fts (rowid, name) VALUES (new.id, new.name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS cats_fts_delete AFTER DELETE ON cats BEGIN
+            INSERT INTO cats_fts (cats_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS cats_fts_update AFTER UPDATE OF name ON cats BEGIN
+            INSERT INTO cats_fts (cats_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            INSERT INTO cats_fts (rowid, name) VALUES (new.id, new.name);
+        END;
+    ''')
+    if not exists:
+        # 首次创建时为已有数据建立索引
+        conn.execute("INSERT INTO cats_fts (cats_fts) VALUES ('rebuild')")
+        logger.info("Built full-text search index for cat names")
+    SEARCH_FTS_ENABLED = True
+
+def search_fts_enabled(conn):
+    """源数据库中是否已有 FTS5 索引及其同步触发器
+
+    不依赖 init_db() 是否在本进程中运行过（flask run / WSGI 下不会运行），
+    第一次使用时查询 sqlite_master，结果缓存在 SEARCH_FTS_ENABLED 中。
+    """
+    global SEARCH_FTS_ENABLED
+    if SEARCH_FTS_ENABLED is None:
+        placeholders = ','.join('?' * len(SEARCH_FTS_OBJECTS))
+        found = conn.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({placeholders})", SEARCH_FTS_OBJECTS
+        ).fetchone()[0]
+        SEARCH_FTS_ENABLED = found == len(SEARCH_FTS_OBJECTS)
+        if not SEARCH_FTS_ENABLED:
+            logger.warning("FTS5 search index not found, search falls back to LIKE (run init_db to create it)")
+    return SEARCH_FTS_ENABLED
+
 def get_db_connection():
-    """获取收藏数据库连接"""
-    conn = sqlite3.connect(FAVRITE_DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """获取收藏数据库连接（同一请求内复用，请求结束后归还连接池）"""
+    if 'favorite_db' not in g:
+        g.favorite_db = favorite_db_pool.acquire()
+    return g.favorite_db
 
 def get_source_db_connection():
-    """获取源数据库连接"""
-    conn = sqlite3.connect(SOURCE_DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """获取源数据库连接（同一请求内复用，请求结束后归还连接池）"""
+    if 'source_db' not in g:
+        g.source_db = source_db_pool.acquire()
+    return g.source_db
+
+@app.teardown_appcontext
+def release_db_connections(exception):
+    """请求结束时把数据库连接归还连接池"""
+    conn = g.pop('favorite_db', None)
+    if conn is not None:
+        favorite_db_pool.release(conn)
+    conn = g.pop('source_db', None)
+    if conn is not None:
+        source_db_pool.release(conn)
+
+class CatIdSampler:
+    """源数据库 id 的内存索引，随机抽样只需 O(k)，不再对整张表 ORDER BY RANDOM()
+
+    新插入的行通过比较 MAX(id)（走主键索引，O(log n)）增量追加，
+    发现行被删除时调用 invalidate() 触发下一次全量重载。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = []
+        self.max_id = None
+        self.stale = True
+
+    def invalidate(self):
+        self.stale = True
+
+    def current_ids(self, conn):
+        """返回当前所有 id（升序）；列表只会被追加或整体替换，调用方可安全持有"""
+        max_id = conn.execute('SELECT MAX(id) FROM cats').fetchone()[0]
+        with self.lock:
+            if self.stale or self.max_id is None or max_id is None or max_id < self.max_id:
+                self.ids = [row[0] for row in conn.execute('SELECT id FROM cats ORDER BY id')]
+                self.stale = False
+            elif max_id > self.max_id:
+                self.ids.extend(row[0] for row in conn.execute(
+                    'SELECT id FROM cats WHERE id > ? ORDER BY id', (self.max_id,)
+                ))
+            self.max_id = max_id
+            return self.ids
+
+cat_id_sampler = CatIdSampler()
+
+SHUFFLE_ROUNDS = 4
+
+def new_shuffle_cursor(n):
+    """创建一个不重复遍历 n 个位置的游标：每个会话一个随机密钥，第 i 张取 shuffle_position(cursor, i)"""
+    return {'n': n, 'key': random.getrandbits(64), 'i': 0}
+
+def shuffle_position(cursor, i):
+    """
+    以会话密钥为轮函数的小型 Feistel 网络是 [0, 4^h) 上的伪随机排列，
+    结果超出 [0, n) 时继续映射（cycle-walking），直到落回范围内；i 互不相同则位置互不相同
+    """
+    n = cursor['n']
+    half_bits = max(1, ((n - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    key = cursor['key'].to_bytes(8, 'big')
+    x = i
+    while True:
+        left, right = x >> half_bits, x & mask
+        for r in range(SHUFFLE_ROUNDS):
+            digest = hashlib.blake2b(right.to_bytes(8, 'big') + bytes([r]), key=key, digest_size=8).digest()
+            left, right = right, left ^ (int.from_bytes(digest, 'big') & mask)
+        x = (left << half_bits) | right
+        if x < n:
+            return x
 
-def fetch_multiple_cats(count=5):
-    """从源数据库获取多张猫咪图片，包含名字"""
+def parse_shuffle_cursor(value, total):
+    """解析会话中保存的游标；格式不对或数据已减少时返回 None"""
+    try:
+        n, key, i = value.split('-')
+        n, key, i = int(n), int(key, 16), int(i)
+    except (AttributeError, ValueError):
+        return None
+    if not (0 < n <= total and 0 <= key < 2 ** 64 and 0 <= i <= n):
+        return None
+    return {'n': n, 'key': key, 'i': i}
+
+def format_shuffle_cursor(cursor):
+    return f"{cursor['n']}-{cursor['key']:x}-{cursor['i']}"
+
+def load_cats_by_ids(conn, ids):
+    """按给定 id 顺序读取猫咪并转换为前端格式"""
+    if not ids:
+        return []
+    placeholders = ','.join('?' * len(ids))
+    rows = conn.execute(
+        f'SELECT id, name, file_path FROM cats WHERE id IN ({placeholders})',
+        ids
+    ).fetchall()
+    by_id = {row['id']: row for row in rows}
+    
+    cat_data = []
+    for cat_id in ids:
+        cat = by_id.get(cat_id)
+        if cat is None:
+            continue
+        file_path = normalize_path(cat['file_path'])
+        
+        if file_path.startswith('cats/'):
+            relative_path = file_path[5:]
+        else:
+            relative_path = file_path
+        
+        cat_data.append({
+            'name': cat['name'],
+            'url': f"/cats/{relative_path}",
+            **thumbnail_fields(relative_path)
+        })
+    return cat_data
+
+def fetch_multiple_cats(count=5, no_repeat=False):
+    """从源数据库获取多张猫咪图片，包含名字
+
+    no_repeat=True 时按会话中保存的随机排列依次取图，全部看完之前不会重复；
+    看完一轮后自动开始新的一轮（包含期间新增的猫咪）。
+    """
     try:
         conn = get_source_db_connection()
-        cats = conn.execute(
-            'SELECT id, name, file_path, time FROM cats ORDER BY RANDOM() LIMIT ?',
-            (count,)
-        ).fetchall()
-        conn.close()
+        ids = cat_id_sampler.current_ids(conn)
+        total = len(ids)
         
-        cat_data = []
-        for cat in cats:
-            file_path = normalize_path(cat['file_path'])
-            
-            if file_path.startswith('cats/'):
-                relative_path = file_path[5:]
-            else:
-                relative_path = file_path
-            
-            cat_data.append({
-                'name': cat['name'],
-                'url': f"/cats/{relative_path}"
-            })
+        if total == 0:
+            picked = []
+        elif no_repeat:
+            cursor = parse_shuffle_cursor(session.get('cat_cursor'), total) or new_shuffle_cursor(total)
+            picked = []
+            for _ in range(min(count, total)):
+                if cursor['i'] >= cursor['n']:
+                    cursor = new_shuffle_cursor(total)
+                position = shuffle_position(cursor, cursor['i'])
+                cursor['i'] += 1
+                picked.append(ids[position])
+            session['cat_cursor'] = format_shuffle_cursor(cursor)
+        else:
+            picked = random.sample(ids, min(count, total))
+        
+        cat_data = load_cats_by_ids(conn, picked)
+        
+        if len(cat_data) < len(picked):
+            # 有行被删除，下次重新加载 id 索引
+            cat_id_sampler.invalidate()
         
         logger.info(f"Requested {count} cats, received {len(cat_data)} cats from source database")
         return cat_data
@@ -150,6 +759,22 @@ def serve_cat_image(filepath):
     # 它能安全地处理子目录和防止路径穿越
     return send_from_directory(UPLOAD_FOLDER, filepath)
 
+@app.route('/thumbs/<int:width>/<path:filepath>')
+def serve_cat_thumbnail(width, filepath):
+    """提供指定宽度的缩略图，缺失时即时生成；未安装 Pillow 时重定向到原图"""
+    if width not in THUMBNAIL_WIDTHS:
+        return jsonify({'success': False, 'error': 'Unsupported thumbnail width'}), 404
+    if THUMBNAIL_DIR in normalize_path(filepath).split('/'):
+        # 不为缩略图本身再生成缩略图
+        return jsonify({'success': False, 'error': 'Image not found'}), 404
+    if Image is None:
+        return redirect(url_for('serve_cat_image', filepath=filepath))
+    
+    thumb_relative = generate_thumbnail(filepath, width)
+    if thumb_relative is None:
+        return jsonify({'success': False, 'error': 'Image not found'}), 404
+    return send_from_directory(UPLOAD_FOLDER, thumb_relative, max_age=86400)
+
 @app.route('/api/add_cat_to_source', methods=['POST'])
 def api_add_cat_to_source():
     """API: 向源数据库添加猫咪图片"""
@@ -162,17 +787,24 @@ def api_add_cat_to_source():
     
     try:
         conn = get_source_db_connection()
-        # 检查文件路径是否已经存在
-        existing = conn.execute('SELECT id FROM cats WHERE file_path = ?', (file_path,)).fetchone()
+        # 检查同名的这张图片是否已经存在
+        existing = conn.execute(
+            'SELECT id FROM cats WHERE name = ? AND file_path = ?', (name, file_path)
+        ).fetchone()
         
         if existing:
-            conn.close()
             return jsonify({'success': False, 'error': 'File path already exists'})
         
+        # 只为 UPLOAD_FOLDER 中已存在的文件记录内容哈希
+        os_file_path = upload_os_path(file_path)
+        content_hash = hash_file(os_file_path) if os_file_path and os.path.isfile(os_file_path) else None
+        
         # 添加到源数据库
-        conn.execute('INSERT INTO cats (name, file_path) VALUES (?, ?)', (name, file_path))
+        conn.execute(
+            'INSERT INTO cats (name, file_path, content_hash) VALUES (?, ?, ?)',
+            (name, file_path, content_hash)
+        )
         conn.commit()
-        conn.close()
         
         logger.info(f"Added cat to source database: {name} - {file_path}")
         return jsonify({'success': True, 'message': 'Cat added to source database'})
@@ -186,8 +818,9 @@ def api_get_cats():
     """API: 获取随机猫咪图片"""
     count = request.args.get('count', 5, type=int)
     count = min(count, 20)  # 限制最大数量
+    no_repeat = request.args.get('no_repeat', '0') == '1'
     
-    cat_data = fetch_multiple_cats(count)
+    cat_data = fetch_multiple_cats(count, no_repeat=no_repeat)
     return jsonify({
         'success': True,
         'cats': cat_data,
@@ -203,30 +836,17 @@ def api_save_cat():
     if not image_url:
         return jsonify({'success': False, 'error': 'Missing image_url'}), 400
     
-    # 从URL中提取文件路径
-    if image_url.startswith('/cats/'):
-        relative_path = image_url[6:]  # 移除 '/cats/' 前缀
-        file_path = f"cats/{relative_path}"
-    else:
-        file_path = image_url
-    
-    # 标准化路径分隔符为正斜杠（用于数据库存储）
-    file_path = file_path.replace('\\', '/')
+    file_path = image_url_to_file_path(image_url)
     
     try:
         conn = get_db_connection()
-        # 检查是否已经收藏
-        existing = conn.execute('SELECT id FROM cats WHERE file_path = ?', (file_path,)).fetchone()
+        # file_path 上有唯一索引，已收藏时插入被忽略
+        result = conn.execute('INSERT OR IGNORE INTO cats (file_path) VALUES (?)', (file_path,))
+        conn.commit()
         
-        if existing:
-            conn.close()
+        if result.rowcount == 0:
             return jsonify({'success': False, 'error': 'Already saved'})
         
-        # 保存到数据库
-        conn.execute('INSERT INTO cats (file_path) VALUES (?)', (file_path,))
-        conn.commit()
-        conn.close()
-        
         logger.info(f"Saved cat image: {file_path}")
         return jsonify({'success': True, 'message': 'Cat saved to favorites'})
     
@@ -242,7 +862,6 @@ def api_get_favorites():
         cats = conn.execute(
             'SELECT id, file_path, created_at FROM cats ORDER BY id DESC LIMIT 50'
         ).fetchall()
-        conn.close()
         
         favorites = []
         for cat in cats:
@@ -259,6 +878,7 @@ def api_get_favorites():
             favorites.append({
                 'id': cat['id'],
                 'url': f"/cats/{relative_path}",
+                **thumbnail_fields(relative_path),
                 'created_at': cat['created_at']
             })
         
@@ -272,6 +892,43 @@ def api_get_favorites():
         logger.error(f"FAVRITE_DATABASE error: {e}")
         return jsonify({'success': False, 'error': 'FAVRITE_DATABASE error'}), 500
 
+FAVORITE_STATUS_MAX_URLS = 200
+
+@app.route('/api/favorites/status', methods=['POST'])
+def api_favorites_status():
+    """API: 批量查询图片是否已收藏，返回 {图片URL: 是否已收藏}"""
+    data = request.get_json(silent=True) or {}
+    image_urls = data.get('image_urls')
+    
+    if not isinstance(image_urls, list) or not all(isinstance(url, str) for url in image_urls):
+        return jsonify({'success': False, 'error': 'image_urls must be a list of strings'}), 400
+    if len(image_urls) > FAVORITE_STATUS_MAX_URLS:
+        return jsonify({'success': False, 'error': f'At most {FAVORITE_STATUS_MAX_URLS} image_urls per request'}), 400
+    
+    paths = {url: image_url_to_file_path(url) for url in image_urls}
+    unique_paths = list(set(paths.values()))
+    
+    try:
+        conn = get_db_connection()
+        saved = set()
+        if unique_paths:
+            # file_path 上有唯一索引，IN 查询逐个走索引
+            placeholders = ','.join('?' * len(unique_paths))
+            rows = conn.execute(
+                f'SELECT file_path FROM cats WHERE file_path IN ({placeholders})',
+                unique_paths
+            ).fetchall()
+            saved = {row['file_path'] for row in rows}
+        
+        return jsonify({
+            'success': True,
+            'status': {url: path in saved for url, path in paths.items()}
+        })
+    
+    except sqlite3.Error as e:
+        logger.error(f"FAVRITE_DATABASE error: {e}")
+        return jsonify({'success': False, 'error': 'FAVRITE_DATABASE error'}), 500
+
 @app.route('/api/remove_favorite', methods=['POST'])
 def api_remove_favorite():
     """API: 从收藏中移除猫咪图片"""
@@ -287,10 +944,8 @@ def api_remove_favorite():
         conn.commit()
         
         if result.rowcount > 0:
-            conn.close()
             return jsonify({'success': True, 'message': 'Cat removed from favorites'})
         else:
-            conn.close()
             return jsonify({'success': False, 'error': 'Cat not found'}), 404
     
     except sqlite3.Error as e:
@@ -306,15 +961,7 @@ def api_remove_favorite_by_url():
     if not image_url:
         return jsonify({'success': False, 'error': 'Missing image_url'}), 400
     
-    # 从URL中提取文件路径
-    if image_url.startswith('/cats/'):
-        relative_path = image_url[6:]  # 移除 '/cats/' 前缀
-        file_path = f"cats/{relative_path}"
-    else:
-        file_path = image_url
-    
-    # 标准化路径分隔符为正斜杠（用于数据库存储）
-    file_path = file_path.replace('\\', '/')
+    file_path = image_url_to_file_path(image_url)
     
     try:
         conn = get_db_connection()
@@ -322,11 +969,9 @@ def api_remove_favorite_by_url():
         conn.commit()
         
         if result.rowcount > 0:
-            conn.close()
             logger.info(f"Removed cat image from favorites: {file_path}")
             return jsonify({'success': True, 'message': 'Cat removed from favorites'})
         else:
-            conn.close()
             return jsonify({'success': False, 'error': 'Cat not found in favorites'})
     
     except sqlite3.Error as e:
@@ -354,6 +999,9 @@ def api_import_cats_from_api():
         # 下载图片并保存到源数据库
         conn = get_source_db_connection()
         imported_count = 0
+        duplicate_count = 0
+        reused_count = 0
+        imported_paths = []
         
         for cat in cat_data:
             cat_url = cat['url']
@@ -365,38 +1013,63 @@ def api_import_cats_from_api():
             file_name = f"{cat_id}.{file_ext}"
             file_path = f"cats/{file_name}"
             
-            # 检查文件路径是否已经存在
-            existing = conn.execute('SELECT id FROM cats WHERE file_path = ?', (file_path,)).fetchone()
+            # 检查这张远程图片是否已经导入过（可能引用了内容相同的已有文件）
+            existing = conn.execute(
+                'SELECT id FROM cats WHERE file_path = ? OR name = ?', (file_path, cat_name)
+            ).fetchone()
             
             if not existing:
-                # 下载图片
+                # 下载图片，边写入临时文件边计算内容哈希
                 try:
-                    img_response = requests.get(cat_url, timeout=10)
+                    img_response = requests.get(cat_url, timeout=10, stream=True)
                     img_response.raise_for_status()
                     
                     # 保存图片文件 - 使用OS路径
                     os_file_path = file_path.replace('/', os.sep)
-                    with open(os_file_path, 'wb') as f:
-                        f.write(img_response.content)
+                    tmp_path, content_hash = write_stream_hashed(
+                        img_response.iter_content(HASH_CHUNK_SIZE), os_file_path
+                    )
+                    
+                    # 内容相同的图片已经入库（远程 id 不同）时不再保存第二份文件，
+                    # 新记录直接引用已有的文件
+                    existing_blob = find_cat_by_hash(conn, content_hash)
+                    if existing_blob:
+                        os.remove(tmp_path)
+                        if find_cat_by_hash(conn, content_hash, cat_name):
+                            duplicate_count += 1
+                            continue
+                        file_path = normalize_path(existing_blob['file_path'])
+                        reused_count += 1
+                        logger.info(f"Image {cat_url} has the same content as {file_path}, sharing the file")
+                    else:
+                        os.replace(tmp_path, os_file_path)
+                        imported_paths.append(file_name)
+                        logger.info(f"Downloaded and saved: {file_path}")
                     
                     # 添加到数据库 - 使用标准化路径
-                    conn.execute('INSERT INTO cats (name, file_path) VALUES (?, ?)', (cat_name, file_path))
+                    conn.execute(
+                        'INSERT INTO cats (name, file_path, content_hash) VALUES (?, ?, ?)',
+                        (cat_name, file_path, content_hash)
+                    )
                     imported_count += 1
                     
-                    logger.info(f"Downloaded and saved: {file_path}")
-                    
-                except requests.RequestException as e:
+                except (requests.RequestException, OSError) as e:
                     logger.error(f"Failed to download image {cat_url}: {e}")
                     continue
         
         conn.commit()
-        conn.close()
+        
+        # 入库之后再排入后台处理任务
+        for relative_path in imported_paths:
+            enqueue_post_processing(relative_path)
         
         logger.info(f"Imported {imported_count} cats from API to source database")
         return jsonify({
             'success': True,
             'message': f'Imported {imported_count} cats',
-            'imported_count': imported_count
+            'imported_count': imported_count,
+            'reused_count': reused_count,
+            'duplicate_count': duplicate_count
         })
     
     except requests.RequestException as e:
@@ -406,80 +1079,183 @@ def api_import_cats_from_api():
         logger.error(f"SOURCE_DATABASE error: {e}")
         return jsonify({'success': False, 'error': 'SOURCE_DATABASE error'}), 500
 
+SOURCE_CATS_PAGE_SIZE = 50
+SOURCE_CATS_MAX_PAGE_SIZE = 200
+STREAM_FETCH_ROWS = 500  # 流式响应每次从游标取出的行数
+
+def parse_time_cursor(value):
+    """解析 "time|id" 形式的分页游标，无效时返回 None"""
+    if not value or '|' not in value:
+        return None
+    cursor_time, _, cursor_id = value.rpartition('|')
+    try:
+        return cursor_time, int(cursor_id)
+    except ValueError:
+        return None
+
+def format_source_cat(cat, include_file_path=False):
+    """把源数据库的一行转换为前端使用的字典"""
+    file_path = normalize_path(cat['file_path'])
+    
+    if file_path.startswith('cats/'):
+        relative_path = file_path[5:]
+    else:
+        relative_path = file_path
+    
+    data = {
+        'id': cat['id'],
+        'name': cat['name'],
+        'url': f"/cats/{relative_path}",
+        **thumbnail_fields(relative_path),
+        'time': cat['time']
+    }
+    if include_file_path:
+        data['file_path'] = cat['file_path']
+    return data
+
+def wants_stream():
+    """请求是否要求流式（NDJSON）响应：?stream=1 或 Accept: application/x-ndjson"""
+    return (request.args.get('stream') == '1'
+            or request.accept_mimetypes.best == 'application/x-ndjson')
+
+def stream_ndjson(sql, params, format_row):
+    """逐批读取查询结果并以 NDJSON（每行一个 JSON 对象）流式返回
+
+    每次只从 SQLite 游标取 STREAM_FETCH_ROWS 行，内存占用与匹配的总行数无关。
+    """
+    def generate():
+        cursor = get_source_db_connection().execute(sql, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(STREAM_FETCH_ROWS)
+                if not rows:
+                    break
+                yield ''.join(json.dumps(format_row(row), ensure_ascii=False) + '\n' for row in rows)
+        except sqlite3.Error as e:
+            # 响应头已经发出，只能记录错误并结束流
+            logger.error(f"Streaming query failed: {e}")
+        finally:
+            cursor.close()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/source_cats')
 def api_get_source_cats():
-    """API: 获取源数据库中的所有猫咪信息（按时间倒序）"""
+    """API: 分页获取源数据库中的猫咪信息（按时间倒序）
+
+    使用 (time, id) 游标分页：第一页不带 cursor，之后把返回的 next_cursor 原样传回；
+    next_cursor 为 null 表示没有更多数据。
+    流式模式下忽略 limit，从 cursor（如有）开始以 NDJSON 返回全部剩余行。
+    """
+    limit = request.args.get('limit', SOURCE_CATS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, SOURCE_CATS_MAX_PAGE_SIZE))
+    cursor_arg = request.args.get('cursor')
+    cursor = parse_time_cursor(cursor_arg)
+    if cursor_arg and cursor is None:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    
+    sql = 'SELECT id, name, file_path, time FROM cats'
+    params = ()
+    if cursor:
+        sql += ' WHERE (time, id) < (?, ?)'
+        params = cursor
+    sql += ' ORDER BY time DESC, id DESC'
+    
+    if wants_stream():
+        return stream_ndjson(sql, params, lambda cat: format_source_cat(cat, include_file_path=True))
+    
     try:
         conn = get_source_db_connection()
-        cats = conn.execute(
-            'SELECT id, name, file_path, time FROM cats ORDER BY time DESC'
-        ).fetchall()
-        conn.close()
+        # 多取一行用来判断是否还有下一页
+        cats = conn.execute(sql + ' LIMIT ?', (*params, limit + 1)).fetchall()
         
-        source_cats = []
-        for cat in cats:
-            file_path = normalize_path(cat['file_path'])
-            
-            if file_path.startswith('cats/'):
-                relative_path = file_path[5:]
-            else:
-                relative_path = file_path
-            
-            source_cats.append({
-                'id': cat['id'],
-                'name': cat['name'],
-                'url': f"/cats/{relative_path}",
-                'file_path': cat['file_path'],
-                'time': cat['time']
-            })
+        has_more = len(cats) > limit
+        cats = cats[:limit]
+        source_cats = [format_source_cat(cat, include_file_path=True) for cat in cats]
+        
+        next_cursor = None
+        if has_more:
+            last = cats[-1]
+            next_cursor = f"{last['time']}|{last['id']}"
         
         return jsonify({
             'success': True,
             'cats': source_cats,
-            'count': len(source_cats)
+            'count': len(source_cats),
+            'next_cursor': next_cursor
         })
     
     except sqlite3.Error as e:
         logger.error(f"SOURCE_DATABASE error: {e}")
         return jsonify({'success': False, 'error': 'SOURCE_DATABASE error'}), 500
 
+SEARCH_PAGE_SIZE = 30
+SEARCH_MAX_PAGE_SIZE = 100
+
+def escape_like(text):
+    """转义 LIKE 模式中的通配符"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def build_search_query(conn, query):
+    """根据查询长度和 FTS5 是否可用，返回 (计数 SQL, 查询 SQL, 参数)"""
+    if len(query) >= SEARCH_MIN_TRIGRAM_LENGTH and search_fts_enabled(conn):
+        # 整个查询作为一个短语匹配，双引号需要转义
+        match = '"' + query.replace('"', '""') + '"'
+        return (
+            'SELECT COUNT(*) FROM cats_fts WHERE cats_fts MATCH ?',
+            """
+            SELECT c.id, c.name, c.file_path, c.time
+            FROM cats_fts JOIN cats c ON c.id = cats_fts.rowid
+            WHERE cats_fts MATCH ?
+            ORDER BY bm25(cats_fts), c.time DESC, c.id DESC
+            """,
+            (match,)
+        )
+    
+    # 使用 LIKE 进行模糊查询
+    pattern = f'%{escape_like(query)}%'
+    return (
+        "SELECT COUNT(*) FROM cats WHERE name LIKE ? ESCAPE '\\'",
+        "SELECT id, name, file_path, time FROM cats WHERE name LIKE ? ESCAPE '\\' "
+        "ORDER BY time DESC, id DESC",
+        (pattern,)
+    )
+
 @app.route('/api/search_cats')
 def api_search_cats():
-    """API: 根据名字搜索猫咪"""
+    """API: 根据名字搜索猫咪
+
+    查询不少于 3 个字符时使用 FTS5 trigram 索引，按相关度（bm25）再按时间倒序排序；
+    更短的查询退回 LIKE，按时间倒序。支持 limit/offset 分页，total 为匹配总数。
+    流式模式下以 NDJSON 返回 offset 之后的全部匹配。
+    """
     query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', SEARCH_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+    offset = max(0, request.args.get('offset', 0, type=int))
     
     if not query:
-        return jsonify({'success': True, 'cats': [], 'count': 0})
-        
+        if wants_stream():
+            return Response('', mimetype='application/x-ndjson')
+        return jsonify({'success': True, 'cats': [], 'count': 0, 'total': 0, 'has_more': False})
+    
     try:
         conn = get_source_db_connection()
-        # 使用 LIKE 进行模糊查询
-        cats = conn.execute(
-            "SELECT id, name, file_path, time FROM cats WHERE name LIKE ? ORDER BY time DESC",
-            (f'%{query}%',)
-        ).fetchall()
-        conn.close()
+        count_sql, sql, params = build_search_query(conn, query)
         
-        searched_cats = []
-        for cat in cats:
-            file_path = normalize_path(cat['file_path'])
-            
-            if file_path.startswith('cats/'):
-                relative_path = file_path[5:]
-            else:
-                relative_path = file_path
-            
-            searched_cats.append({
-                'id': cat['id'],
-                'name': cat['name'],
-                'url': f"/cats/{relative_path}",
-                'time': cat['time']
-            })
+        if wants_stream():
+            return stream_ndjson(sql + ' LIMIT -1 OFFSET ?', (*params, offset), format_source_cat)
+        
+        total = conn.execute(count_sql, params).fetchone()[0]
+        cats = conn.execute(sql + ' LIMIT ? OFFSET ?', (*params, limit, offset)).fetchall()
+        searched_cats = [format_source_cat(cat) for cat in cats]
             
         return jsonify({
             'success': True,
             'cats': searched_cats,
-            'count': len(searched_cats)
+            'count': len(searched_cats),
+            'total': total,
+            'has_more': offset + len(searched_cats) < total
         })
         
     except sqlite3.Error as e:
@@ -524,13 +1300,46 @@ def api_upload_cats():
                 os_file_path = normalized_path.replace('/', os.sep)
                 
                 try:
-                    # 保存文件
-                    file.save(os_file_path)
+                    # 保存文件，边写入边计算内容哈希
+                    tmp_path, content_hash = write_stream_hashed(
+                        iter(lambda: file.stream.read(HASH_CHUNK_SIZE), b''), os_file_path
+                    )
+                    
+                    # 同样内容的图片已经入库时不再保存第二份文件
+                    existing_blob = find_cat_by_hash(conn, content_hash)
+                    if existing_blob:
+                        os.remove(tmp_path)
+                        shared_path = normalize_path(existing_blob['file_path'])
+                        
+                        # 同名的记录也已存在：完全重复，不再新增记录
+                        if find_cat_by_hash(conn, content_hash, cat_name):
+                            uploaded_files.append({
+                                'filename': file.filename,
+                                'path': shared_path,
+                                'duplicate': True
+                            })
+                            logger.info(f"Duplicate upload {file.filename}, already stored as {cat_name}")
+                            continue
+                        
+                        # 名字不同：新增一条引用已有文件的记录
+                        conn.execute(
+                            'INSERT INTO cats (name, file_path, content_hash) VALUES (?, ?, ?)',
+                            (cat_name, shared_path, content_hash)
+                        )
+                        uploaded_files.append({
+                            'filename': file.filename,
+                            'path': shared_path,
+                            'shared': True,
+                            'shared_with': existing_blob['name']
+                        })
+                        logger.info(f"Upload {file.filename} has the same content as {shared_path}, sharing the file")
+                        continue
+                    os.replace(tmp_path, os_file_path)
                     
                     # 添加到数据库
                     conn.execute(
-                        'INSERT INTO cats (name, file_path) VALUES (?, ?)',
-                        (cat_name, normalized_path)
+                        'INSERT INTO cats (name, file_path, content_hash) VALUES (?, ?, ?)',
+                        (cat_name, normalized_path, content_hash)
                     )
                     
                     uploaded_files.append({
@@ -546,13 +1355,21 @@ def api_upload_cats():
                     continue
         
         conn.commit()
-        conn.close()
+        
+        # 入库之后再排入后台处理任务，请求立即返回
+        for uploaded in uploaded_files:
+            uploaded['task_id'] = enqueue_post_processing(uploaded['path'][len('cats/'):])
         
         if uploaded_files:
+            duplicate_count = sum(1 for uploaded in uploaded_files if uploaded.get('duplicate'))
+            reused_count = sum(1 for uploaded in uploaded_files if uploaded.get('shared'))
+            uploaded_count = len(uploaded_files) - duplicate_count
             return jsonify({
                 'success': True,
-                'message': f'Successfully uploaded {len(uploaded_files)} images for {cat_name}',
-                'uploaded_count': len(uploaded_files),
+                'message': f'Successfully uploaded {uploaded_count} images for {cat_name}',
+                'uploaded_count': uploaded_count,
+                'reused_count': reused_count,
+                'duplicate_count': duplicate_count,
                 'cat_name': cat_name,
                 'files': uploaded_files
             })
@@ -563,39 +1380,106 @@ def api_upload_cats():
         logger.error(f"Upload error: {e}")
         return jsonify({'success': False, 'error': 'Upload failed'}), 500
 
+@app.route('/api/tasks')
+def api_task_stats():
+    """API: 后台任务队列各状态的任务数量"""
+    try:
+        return jsonify({'success': True, 'tasks': task_queue.stats()})
+    except sqlite3.Error as e:
+        logger.error(f"TASK_DATABASE error: {e}")
+        return jsonify({'success': False, 'error': 'TASK_DATABASE error'}), 500
+
+@app.route('/api/tasks/<int:task_id>')
+def api_get_task(task_id):
+    """API: 查询单个后台任务的状态"""
+    try:
+        task = task_queue.get(task_id)
+    except sqlite3.Error as e:
+        logger.error(f"TASK_DATABASE error: {e}")
+        return jsonify({'success': False, 'error': 'TASK_DATABASE error'}), 500
+    if task is None:
+        return jsonify({'success': False, 'error': 'Task not found'}), 404
+    return jsonify({'success': True, 'task': task})
+
 # 添加识别功能的路由
 # --- 1. 修改调用AI服务器的函数 ---
 
-def recognize_cat(image_path):
+def recognition_request(method, path, timeout=None, is_saturated=None, **kwargs):
     """
-    调用AI识别服务器来识别猫咪。
-    返回一个包含详细识别结果的字典，如果失败则返回None。
+    通过共享的长连接会话请求识别服务器。
+    连接被重置或拒绝时按指数退避重试；读超时不重试，避免重复占用识别服务器。
+    熔断器打开时直接抛出 RecognitionServerUnavailable。
+    is_saturated(response) 用于识别 2xx 响应中“服务器过载”的情况（如批量结果全部超时），
+    返回 True 时与 408 一样计为熔断器的失败。
     """
-    # AI识别服务器的地址
-    RECOGNITION_SERVER_URL = "http://localhost:2255/recognize"
+    if not recognition_breaker.allow_request():
+        raise RecognitionServerUnavailable()
 
+    url = app.config['RECOGNITION_SERVER_URL'].rstrip('/') + path
+    if timeout is None:
+        timeout = (app.config['RECOGNITION_CONNECT_TIMEOUT'], app.config['RECOGNITION_READ_TIMEOUT'])
+    retries = app.config['RECOGNITION_RETRIES']
+    response = None
     try:
-        with open(image_path, 'rb') as f:
-            files = {'image': f}
-
-            # 发送请求到AI服务器，设置一个合理的超时
-            response = requests.post(
-                RECOGNITION_SERVER_URL,
-                files=files,
-                timeout=30  # 设置30秒超时，防止无限等待
-            )
+        for attempt in range(retries + 1):
+            try:
+                response = recognition_session.request(method, url, timeout=timeout, **kwargs)
+                break
+            except requests.exceptions.ConnectionError as e:
+                if attempt >= retries or isinstance(e, requests.exceptions.ConnectTimeout):
+                    raise
+                delay = app.config['RECOGNITION_RETRY_BACKOFF'] * (2 ** attempt)
+                logger.warning(f"连接AI识别服务失败 ({e})，{delay:.1f} 秒后重试...")
+                time.sleep(delay)
+    finally:
+        # 识别服务器用 500 返回“未检测到猫脸”等业务错误，只有网关类错误和过载（408 识别超时）才算后端故障
+        if response is None or response.status_code in (408, 502, 503, 504):
+            recognition_breaker.record_failure()
+        elif is_saturated is not None and response.ok and is_saturated(response):
+            logger.warning("AI识别服务过载：批量识别结果全部超时")
+            recognition_breaker.record_failure()
+        else:
+            recognition_breaker.record_success()
+    return response
 
-            response.raise_for_status()  # 如果状态码不是2xx，则抛出异常
 
-            result = response.json()
-            if result.get('success'):
-                # 成功时，返回整个 'data' 对象
-                return result.get('data')
-            else:
-                # AI服务器返回了 'success': False
-                logger.warning(f"AI服务器识别失败: {result.get('error')}")
-                return {'error': result.get('error', 'unknown_ai_error')}
+def batch_timed_out(response):
+    """/recognize_batch 的结果中有超时且没有任何一张识别成功，说明识别服务器已经过载"""
+    try:
+        items = response.json().get('results', [])
+    except ValueError:
+        return False
+    return (any(item.get('error') == 'timeout' for item in items)
+            and not any(item.get('success') for item in items))
+
+
+def recognize_image(filename, data, mimetype='application/octet-stream'):
+    """
+    调用AI识别服务器识别内存中的一张图片。
+    成功时返回包含详细识别结果的字典，失败时返回 {'error': ...}。
+    """
+    try:
+        # 发送请求到AI服务器（超时和重试见 recognition_request）
+        response = recognition_request('POST', '/recognize', files={'image': (filename, data, mimetype)})
 
+        if response.status_code == 408:
+            # 识别服务器在自己的期限内没有处理完（过载）
+            logger.error("AI识别服务处理超时。")
+            return {'error': 'ai_server_timeout'}
+        response.raise_for_status()  # 如果状态码不是2xx，则抛出异常
+
+        result = response.json()
+        if result.get('success'):
+            # 成功时，返回整个 'data' 对象
+            return result.get('data')
+        else:
+            # AI服务器返回了 'success': False
+            logger.warning(f"AI服务器识别失败: {result.get('error')}")
+            return {'error': result.get('error', 'unknown_ai_error')}
+
+    except RecognitionServerUnavailable:
+        logger.warning("AI识别服务熔断中，快速失败。")
+        return {'error': 'ai_server_unavailable'}
     except requests.exceptions.Timeout:
         logger.error("连接AI识别服务超时。")
         return {'error': 'ai_server_timeout'}
@@ -607,8 +1491,174 @@ def recognize_cat(image_path):
         return {'error': 'unknown_processing_error'}
 
 
+def recognize_cats_batch(images):
+    """
+    通过 /recognize_batch 一次识别多张图片。
+    images 为 (filename, 图片字节, mimetype) 列表；返回与之等长的结果列表，
+    每项为识别数据字典，失败时为 {'error': ...}。
+    """
+    try:
+        files = [('images', (filename, data, mimetype)) for filename, data, mimetype in images]
+        response = recognition_request('POST', '/recognize_batch', is_saturated=batch_timed_out, files=files)
+        response.raise_for_status()
+
+        result = response.json()
+        if not result.get('success'):
+            logger.warning(f"AI服务器批量识别失败: {result.get('error')}")
+            return [{'error': result.get('error', 'unknown_ai_error')}] * len(images)
+        results = [item.get('data') if item.get('success') else {'error': item.get('error', 'unknown_ai_error')}
+                   for item in result.get('results', [])]
+        if len(results) != len(images):
+            logger.error(f"AI服务器返回的结果数量 ({len(results)}) 与图片数量 ({len(images)}) 不一致")
+            return [{'error': 'unknown_processing_error'}] * len(images)
+        return results
+
+    except RecognitionServerUnavailable:
+        logger.warning("AI识别服务熔断中，快速失败。")
+        return [{'error': 'ai_server_unavailable'}] * len(images)
+    except requests.exceptions.Timeout:
+        logger.error("连接AI识别服务超时。")
+        return [{'error': 'ai_server_timeout'}] * len(images)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"连接AI识别服务时发生错误: {e}")
+        return [{'error': 'ai_server_connection_error'}] * len(images)
+    except Exception as e:
+        logger.error(f"处理AI服务响应时发生未知错误: {e}")
+        return [{'error': 'unknown_processing_error'}] * len(images)
+
+
+def run_bounded(func, items, limit, on_result=None):
+    """
+    在共享识别线程池中并发执行 func(item)，单个请求最多同时占用 limit 个线程。
+    结果按 items 的顺序返回；func 抛出的异常会转换为 {'error': ...}。
+    提供 on_result(index, result) 时，每个任务完成后立即在工作线程中回调。
+    """
+    slots = threading.Semaphore(limit)
+
+    def guarded(index, item):
+        try:
+            result = func(item)
+        except Exception as e:
+            logger.error(f"并发识别任务发生错误: {e}", exc_info=True)
+            result = {'error': f'Processing error: {str(e)}'}
+        try:
+            if on_result is not None:
+                on_result(index, result)
+        finally:
+            slots.release()
+        return result
+
+    futures = []
+    for index, item in enumerate(items):
+        slots.acquire()
+        try:
+            futures.append(recognition_executor.submit(guarded, index, item))
+        except Exception:
+            slots.release()
+            raise
+    return [future.result() for future in futures]
+
+
+def format_recognition_entry(filename, ai_result):
+    """把识别服务器的返回转换为前端使用的单张图片结果，返回 (entry, 是否识别成功)。"""
+    if ai_result and not ai_result.get('error'):
+        # AI服务器成功返回了识别数据
+        logger.info(f"AI识别成功: {filename} -> {ai_result.get('cat_name')} (Sim: {ai_result.get('similarity')})")
+        return {
+            'filename': filename,
+            'status': ai_result.get('status'),  # 'matched' or 'unmatched'
+            'cat_name': ai_result.get('cat_name'),  # "Garfield" or "待定 (Unknown)"
+            'similarity': ai_result.get('similarity'),  # 相似度得分
+            'message': ai_result.get('message')  # AI服务器给出的提示信息
+        }, True
+
+    # 识别失败 (连接失败、AI服务器出错或未检测到猫脸等)
+    error_message = ai_result.get('error', 'Recognition failed') if ai_result else 'Recognition failed'
+    logger.warning(f"AI识别失败: {filename}, 原因: {error_message}")
+    return {'filename': filename, 'error': error_message}, False
+
+
+def suggest_cat_name(recognition_results):
+    """只对成功匹配 (status == 'matched') 的猫进行统计，返回最常见的名字（可能为 None）。"""
+    matched_cat_names = [
+        res['cat_name'] for res in recognition_results if res.get('status') == 'matched'
+    ]
+    most_common = Counter(matched_cat_names).most_common(1)
+    return most_common[0][0] if most_common else None
+
+
+class RecognitionJob:
+    """
+    一个异步识别任务。
+    每张图片识别完成后立即追加到 results（按完成顺序，带原始序号 index），
+    等待中的轮询/SSE 请求通过 condition 被唤醒。
+    """
+
+    def __init__(self, total):
+        self.job_id = str(uuid.uuid4())
+        self.total = total
+        self.results = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self.condition = threading.Condition()
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def add_result(self, index, entry, success):
+        with self.condition:
+            self.results.append(dict(entry, index=index, success=success))
+            if len(self.results) >= self.total:
+                self.finished_at = time.time()
+            self.condition.notify_all()
+
+    def wait_for_results(self, seen, timeout):
+        """等待出现第 seen 条之后的新结果或任务结束，返回新的结果列表。"""
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.results) > seen or self.done, timeout)
+            return list(self.results[seen:])
+
+    def summary(self):
+        with self.condition:
+            succeeded = [res for res in self.results if res['success']]
+            return {
+                'job_id': self.job_id,
+                'status': 'done' if self.done else 'running',
+                'total': self.total,
+                'completed': len(self.results),
+                'recognized_count': len(succeeded),
+                'failed_count': len(self.results) - len(succeeded),
+                'suggested_name': suggest_cat_name(succeeded),
+            }
+
+
+recognition_jobs = {}
+recognition_jobs_lock = threading.Lock()
+
+
+def purge_expired_jobs():
+    """清理完成超过 RECOGNITION_JOB_TTL 秒的任务，避免结果无限累积。"""
+    now = time.time()
+    with recognition_jobs_lock:
+        for job_id in [job_id for job_id, job in recognition_jobs.items()
+                       if job.done and now - job.finished_at > RECOGNITION_JOB_TTL]:
+            del recognition_jobs[job_id]
+
+
+def get_recognition_job(job_id):
+    with recognition_jobs_lock:
+        return recognition_jobs.get(job_id)
+
+
 # --- 2. 修改主API端点以处理新的返回结构 ---
 
+@app.route('/api/recognition_backend')
+def api_recognition_backend():
+    """API: 识别服务熔断器的状态和计数（用于监控）"""
+    return jsonify({'success': True, 'breaker': recognition_breaker.snapshot()})
+
+
 @app.route('/api/recognize_cats', methods=['POST'])
 def api_recognize_cats():
     """识别多张猫咪图片（仅返回识别结果，不写入数据库）"""
@@ -619,77 +1669,41 @@ def api_recognize_cats():
     if not files or all(f.filename == '' for f in files):
         return jsonify({'success': False, 'error': 'No files selected'}), 400
 
-    tmp_dir = os.path.join(UPLOAD_FOLDER, 'tmp', str(uuid.uuid4()))
-    os.makedirs(tmp_dir, exist_ok=True)
-
     recognition_results = []
     failed_files = []
+    images = []
 
+    # 先读取所有合法图片，再按 RECOGNITION_BATCH_SIZE 分组批量识别
     for file in files:
         if not (file and file.filename and allowed_file(file.filename)):
             failed_files.append({'filename': file.filename, 'error': 'Invalid file or file type'})
             continue
 
         filename = secure_filename(file.filename)
-        temp_path = os.path.join(tmp_dir, f"{uuid.uuid4()}{os.path.splitext(filename)[1].lower()}")
-
         try:
-            file.save(temp_path)
-
-            # 调用更新后的识别函数
-            ai_result = recognize_cat(temp_path)
-
-            if ai_result and not ai_result.get('error'):
-                # AI服务器成功返回了识别数据
-                recognition_results.append({
-                    'filename': filename,
-                    'status': ai_result.get('status'),  # 'matched' or 'unmatched'
-                    'cat_name': ai_result.get('cat_name'),  # "Garfield" or "待定 (Unknown)"
-                    'similarity': ai_result.get('similarity'),  # 相似度得分
-                    'message': ai_result.get('message')  # AI服务器给出的提示信息
-                })
-                logger.info(
-                    f"AI识别成功: {filename} -> {ai_result.get('cat_name')} (Sim: {ai_result.get('similarity')})")
-            else:
-                # 识别失败 (连接失败、AI服务器出错或未检测到猫脸等)
-                error_message = ai_result.get('error', 'Recognition failed') if ai_result else 'Recognition failed'
-                failed_files.append({
-                    'filename': filename,
-                    'error': error_message
-                })
-                logger.warning(f"AI识别失败: {filename}, 原因: {error_message}")
-
+            images.append((filename, file.read(), file.mimetype or 'application/octet-stream'))
         except Exception as e:
             failed_files.append({'filename': filename, 'error': f'Processing error: {str(e)}'})
             logger.error(f"处理文件 {filename} 时发生错误: {e}", exc_info=True)
-        finally:
-            # 确保临时文件被删除
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
 
-    # 清理临时目录
-    try:
-        if os.path.exists(tmp_dir):
-            os.rmdir(tmp_dir)
-    except OSError:
-        pass  # 如果目录非空（说明有其他并行进程），则不删除
+    # 各组并发发送到识别服务器的 /recognize_batch，结果按上传顺序拼接
+    chunks = [images[i:i + RECOGNITION_BATCH_SIZE] for i in range(0, len(images), RECOGNITION_BATCH_SIZE)]
+    chunk_results = run_bounded(recognize_cats_batch, chunks, RECOGNITION_MAX_CONCURRENCY)
+    ai_results = []
+    for chunk, results in zip(chunks, chunk_results):
+        if isinstance(results, dict):  # run_bounded 捕获到的异常
+            results = [results] * len(chunk)
+        ai_results.extend(results)
+
+    for (filename, _, _), ai_result in zip(images, ai_results):
+        entry, success = format_recognition_entry(filename, ai_result)
+        (recognition_results if success else failed_files).append(entry)
 
     if not recognition_results and not failed_files:
         return jsonify({'success': False, 'error': 'No valid files processed'}), 400
 
     # --- 汇总结果 ---
-    # 新的汇总逻辑：只对成功匹配的猫进行统计
-    # 我们只认为 status == 'matched' 的是确认的猫
-    matched_cat_names = [
-        res['cat_name'] for res in recognition_results if res.get('status') == 'matched'
-    ]
-
-    suggested_name = None
-    if matched_cat_names:
-        # 统计最常见的已匹配猫咪名字
-        most_common = Counter(matched_cat_names).most_common(1)
-        if most_common:
-            suggested_name = most_common[0][0]
+    suggested_name = suggest_cat_name(recognition_results)
 
     return jsonify({
         'success': True,
@@ -701,9 +1715,197 @@ def api_recognize_cats():
         'failed_files': failed_files
     })
 
+@app.route('/api/recognize_jobs', methods=['POST'])
+def api_create_recognize_job():
+    """创建异步识别任务：立即返回 job_id，结果通过轮询或 SSE 逐张获取"""
+    if 'files' not in request.files:
+        return jsonify({'success': False, 'error': 'No files provided'}), 400
+
+    files = request.files.getlist('files')
+    if not files or all(f.filename == '' for f in files):
+        return jsonify({'success': False, 'error': 'No files selected'}), 400
+
+    purge_expired_jobs()
+    job = RecognitionJob(len(files))
+    images = []
+    for index, file in enumerate(files):
+        if not (file and file.filename and allowed_file(file.filename)):
+            job.add_result(index, {'filename': file.filename, 'error': 'Invalid file or file type'}, False)
+            continue
+        images.append((index, secure_filename(file.filename), file.read(), file.mimetype or 'application/octet-stream'))
+
+    with recognition_jobs_lock:
+        recognition_jobs[job.job_id] = job
+
+    def on_result(position, ai_result):
+        index, filename, _, _ = images[position]
+        entry, success = format_recognition_entry(filename, ai_result)
+        job.add_result(index, entry, success)
+
+    def run_job():
+        run_bounded(lambda image: recognize_image(image[1], image[2], image[3]),
+                    images, RECOGNITION_MAX_CONCURRENCY, on_result=on_result)
+
+    if images:
+        threading.Thread(target=run_job, name=f'recognize-job-{job.job_id}', daemon=True).start()
+
+    return jsonify({'success': True, **job.summary()}), 202
+
+
+@app.route('/api/recognize_jobs/<job_id>')
+def api_get_recognize_job(job_id):
+    """查询异步识别任务：返回进度和第 since 条之后的结果"""
+    job = get_recognition_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    since = max(request.args.get('since', 0, type=int), 0)
+    with job.condition:
+        results = list(job.results[since:])
+    return jsonify({'success': True, **job.summary(), 'results': results})
+
+
+@app.route('/api/recognize_jobs/<job_id>/events')
+def api_recognize_job_events(job_id):
+    """以 Server-Sent Events 推送异步识别任务的结果：每张图片一个 result 事件，最后一个 done 事件"""
+    job = get_recognition_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+
+    def generate():
+        seen = 0
+        while True:
+            new_results = job.wait_for_results(seen, timeout=15)
+            for result in new_results:
+                yield f"event: result\ndata: {json.dumps(result, ensure_ascii=False)}\n\n"
+            seen += len(new_results)
+            if job.done and seen >= len(job.results):
+                yield f"event: done\ndata: {json.dumps(job.summary(), ensure_ascii=False)}\n\n"
+                return
+            if not new_results:
+                yield ": keepalive\n\n"  # 保持连接
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def remove_image_files(file_path):
+    """删除一张图片及其缩略图（file_path 为数据库中的 cats/... 路径）"""
+    file_path = normalize_path(file_path)
+    relative_path = file_path[len('cats/'):] if file_path.startswith('cats/') else file_path
+    candidates = [file_path.replace('/', os.sep)]
+    candidates += [
+        os.path.join(UPLOAD_FOLDER, thumbnail_relative_path(relative_path, width).replace('/', os.sep))
+        for width in THUMBNAIL_WIDTHS
+    ]
+    for path in candidates:
+        if os.path.isfile(path):
+            os.remove(path)
+
+@app.cli.command('retry-tasks')
+def retry_tasks_command():
+    """把所有已失败（超过重试次数）的后台任务重新放回队列"""
+    count = task_queue.retry_failed()
+    print(f"🔁 已将 {count} 个失败的任务重新放回队列，将在应用运行时执行。")
+
+@app.cli.command('dedupe-cats')
+@click.option('--dry-run', is_flag=True, help='只统计重复图片，不修改数据库和文件')
+def dedupe_cats_command(dry_run):
+    """一次性扫描：补全 content_hash，合并 cats/ 中内容相同的图片
+
+    同一内容只保留最早入库的文件：名字不同的记录改为引用该文件，名字也相同的记录删除，
+    指向被删除文件的收藏改为指向保留的文件；
+    没有入库、但与已入库图片内容相同的文件也会被删除。
+    """
+    init_db()
+    source = open_database(SOURCE_DATABASE)
+    favorites = open_database(FAVRITE_DATABASE)
+    
+    # 1. 为旧数据补全内容哈希
+    hashed = missing = 0
+    for row in source.execute('SELECT id, file_path FROM cats WHERE content_hash IS NULL').fetchall():
+        os_file_path = normalize_path(row['file_path']).replace('/', os.sep)
+        if not os.path.isfile(os_file_path):
+            missing += 1
+            continue
+        source.execute('UPDATE cats SET content_hash = ? WHERE id = ?', (hash_file(os_file_path), row['id']))
+        hashed += 1
+    print(f"📦 补全了 {hashed} 张图片的内容哈希，{missing} 张图片文件不存在")
+    
+    # 2. 内容相同的行改为共用最早入库的文件；名字也相同的才是重复记录，予以删除
+    merged_rows = shared_rows = 0
+    redundant_paths = set()
+    groups = source.execute(
+        'SELECT content_hash FROM cats WHERE content_hash IS NOT NULL '
+        'GROUP BY content_hash HAVING COUNT(*) > 1'
+    ).fetchall()
+    for group in groups:
+        rows = source.execute(
+            'SELECT id, name, file_path FROM cats WHERE content_hash = ? ORDER BY id',
+            (group['content_hash'],)
+        ).fetchall()
+        keep_path = normalize_path(rows[0]['file_path'])
+        kept_names = {rows[0]['name']}
+        for row in rows[1:]:
+            row_path = normalize_path(row['file_path'])
+            if row['name'] in kept_names:
+                source.execute('DELETE FROM cats WHERE id = ?', (row['id'],))
+                merged_rows += 1
+                logger.info(f"Duplicate {row_path} ({row['name']}) merged into {keep_path}")
+            elif row_path != keep_path:
+                source.execute('UPDATE cats SET file_path = ? WHERE id = ?', (keep_path, row['id']))
+                shared_rows += 1
+                logger.info(f"{row_path} ({row['name']}) now shares {keep_path}")
+            kept_names.add(row['name'])
+            
+            if row_path != keep_path:
+                # 收藏改为指向保留的图片，已经收藏过保留图片的直接删除
+                favorites.execute('UPDATE OR IGNORE cats SET file_path = ? WHERE file_path = ?', (keep_path, row_path))
+                favorites.execute('DELETE FROM cats WHERE file_path = ?', (row_path,))
+                redundant_paths.add(row_path)
+    
+    # 只删除已经没有任何记录引用的文件
+    duplicate_paths = [
+        path for path in sorted(redundant_paths)
+        if source.execute('SELECT 1 FROM cats WHERE file_path = ? LIMIT 1', (path,)).fetchone() is None
+    ]
+    
+    # 3. 未入库但与已入库图片内容相同的文件
+    tracked = {normalize_path(row['file_path']) for row in source.execute('SELECT file_path FROM cats')}
+    tracked.update(duplicate_paths)  # 上面已处理的重复行
+    known_hashes = {row[0] for row in source.execute('SELECT content_hash FROM cats WHERE content_hash IS NOT NULL')}
+    stray_paths = []
+    for root, dirs, files in os.walk('cats'):
+        dirs[:] = [d for d in dirs if d != THUMBNAIL_DIR]
+        for name in files:
+            if not allowed_file(name):
+                continue
+            path = normalize_path(os.path.join(root, name))
+            if path not in tracked and hash_file(os.path.join(root, name)) in known_hashes:
+                stray_paths.append(path)
+    
+    if dry_run:
+        source.rollback()
+        favorites.rollback()
+        print(f"🔍 发现 {merged_rows} 条重复记录，{shared_rows} 条记录可共用已有文件，"
+              f"{len(duplicate_paths) + len(stray_paths)} 个重复文件（未做修改）")
+    else:
+        # 先提交数据库再删除文件，数据库不会引用已删除的文件
+        favorites.commit()
+        source.commit()
+        for path in duplicate_paths + stray_paths:
+            remove_image_files(path)
+        print(f"✅ 删除了 {merged_rows} 条重复记录，{shared_rows} 条记录改为共用已有文件，"
+              f"删除了 {len(duplicate_paths) + len(stray_paths)} 个重复文件")
+    source.close()
+    favorites.close()
+
 if __name__ == '__main__':
     # 初始化数据库
     init_db()
     
+    # 调试模式的重载器会先启动一个监视进程，后台任务线程只在实际处理请求的进程中启动
+    debug = True
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        task_queue.start()
+    
     # 启动应用
-    app.run(debug=True, host='0.0.0.0', port=5200)
+    app.run(debug=debug, host='0.0.0.0', port=5200)
@@ -0,0 +1,626 @@
+#!/usr/bin/env python3
+"""
+猫咪识别图库（已知猫咪特征向量）的内存索引。
+识别服务器启动时一次性加载，查询时只需一次矩阵-向量乘法；
+数据库变化时由 GalleryWatcher 增量更新。
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE_FILE = '../cats_recognition.db'
+
+# feature_vectors 的紧凑二进制格式：
+# 16 字节小端头部 (magic 'CEMB', 版本, dtype 编码, 保留, 向量数, 维度) + 连续的小端浮点数据
+EMBEDDING_MAGIC = b'CEMB'
+EMBEDDING_FORMAT_VERSION = 1
+EMBEDDING_HEADER = struct.Struct('<4sBBHII')
+EMBEDDING_DTYPES = {0: np.dtype('<f4'), 1: np.dtype('<f2')}
+EMBEDDING_DTYPE_CODES = {'float32': 0, 'float16': 1}
+
+
+def serialize_vectors(vectors, dtype='float32'):
+    """把一只猫的多条特征向量编码为紧凑二进制格式。"""
+    code = EMBEDDING_DTYPE_CODES[dtype]
+    matrix = np.atleast_2d(np.asarray(vectors, dtype=EMBEDDING_DTYPES[code]))
+    count, dim = matrix.shape
+    header = EMBEDDING_HEADER.pack(EMBEDDING_MAGIC, EMBEDDING_FORMAT_VERSION, code, 0, count, dim)
+    return header + np.ascontiguousarray(matrix).tobytes()
+
+
+def is_legacy_blob(data_blob):
+    return bytes(data_blob[:4]) != EMBEDDING_MAGIC
+
+
+def deserialize_data(data_blob):
+    """
+    解码 feature_vectors，返回 (向量数, 维度) 的数组。
+    新格式用 np.frombuffer 零拷贝读取；迁移过渡期内仍兼容旧的 pickle 数据。
+    """
+    if is_legacy_blob(data_blob):
+        return np.atleast_2d(np.asarray(pickle.loads(data_blob), dtype=np.float32))
+    magic, version, code, _, count, dim = EMBEDDING_HEADER.unpack_from(data_blob)
+    if version != EMBEDDING_FORMAT_VERSION or code not in EMBEDDING_DTYPES:
+        raise ValueError(f"不支持的特征数据格式: version={version}, dtype={code}")
+    return np.frombuffer(data_blob, dtype=EMBEDDING_DTYPES[code], count=count * dim,
+                         offset=EMBEDDING_HEADER.size).reshape(count, dim)
+
+
+def normalize_rows(vectors):
+    """将向量按行做 L2 归一化，返回连续的 float32 矩阵。"""
+    matrix = np.ascontiguousarray(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0  # 零向量保持为零，避免除零
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+# cats 表的行版本：插入或改写 feature_vectors 时由触发器从全局计数器取一个新值，
+# 即使 rowid 被复用或改写后字节数不变，版本号也一定不同
+ROW_VERSION_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS cats_version_seq (value INTEGER NOT NULL);
+    INSERT INTO cats_version_seq (value) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM cats_version_seq);
+    CREATE TRIGGER IF NOT EXISTS cats_version_insert AFTER INSERT ON cats BEGIN
+        UPDATE cats_version_seq SET value = value + 1;
+        UPDATE cats SET version = (SELECT value FROM cats_version_seq) WHERE rowid = new.rowid;
+    END;
+    CREATE TRIGGER IF NOT EXISTS cats_version_update AFTER UPDATE OF feature_vectors ON cats BEGIN
+        UPDATE cats_version_seq SET value = value + 1;
+        UPDATE cats SET version = (SELECT value FROM cats_version_seq) WHERE rowid = new.rowid;
+    END;
+'''
+
+# 读取完整行时使用的列，顺序与 _build_blocks / with_changes 的行元组一致
+ROW_COLUMNS = "rowid, name, feature_vectors, version"
+
+
+def ensure_row_versions(conn):
+    """为识别数据库的 cats 表补上 version 列和维护它的触发器（可重复执行；表不存在时不做任何事）。"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(cats)")}
+    if not columns:
+        return
+    if 'version' not in columns:
+        conn.execute("ALTER TABLE cats ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    conn.executescript(ROW_VERSION_SCHEMA)
+
+
+def row_signature(name, blob_size, version):
+    """
+    一行猫咪数据的变化标记：(名字, feature_vectors 字节数, 行版本)。
+    三者都不需要读出 BLOB 内容（SQLite 的 length() 只读行头），检查变化与特征数据总量无关。
+    """
+    return name, int(blob_size or 0), int(version or 0)
+
+
+# export-mmap 标签文件的格式版本，旧版本的文件会被拒绝并改为从数据库加载
+STORE_FORMAT_VERSION = 3
+
+
+def store_paths(db_path):
+    """内存映射图库文件的位置：与识别数据库放在同一目录。"""
+    base = os.path.splitext(db_path)[0]
+    return base + '.embeddings.npy', base + '.labels.json'
+
+
+def ann_index_path(db_path):
+    """近似最近邻 (IVF) 索引文件的位置：与识别数据库放在同一目录。"""
+    return os.path.splitext(db_path)[0] + '.ivf.npz'
+
+
+class IVFIndex:
+    """
+    纯 NumPy 实现的倒排文件 (IVF) 近似最近邻索引。
+    离线用球面 k-means 训练 nlist 个聚类中心；查询时只在与查询最接近的 nprobe 个聚类中精确比较。
+    nprobe 越大召回率越高、延迟越大；向量数少于 min_vectors 时直接退回精确搜索。
+    """
+
+    def __init__(self, centroids, nprobe=8, min_vectors=20000, row_ids=None, assignments=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.min_vectors = min_vectors
+        # build-ann 时图库每行的 rowid 和所属聚类；图库行序不变时加载后直接复用，不必重新计算
+        self.row_ids = row_ids
+        self.assignments = assignments
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def assign(self, matrix, chunk_size=65536):
+        """返回每条向量所属的聚类编号。"""
+        assignments = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), chunk_size):
+            block = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+            assignments[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def probe(self, query):
+        """返回与查询最接近的 nprobe 个聚类编号。"""
+        scores = self.centroids @ query
+        nprobe = min(self.nprobe, self.nlist)
+        return np.argpartition(-scores, nprobe - 1)[:nprobe]
+
+    @classmethod
+    def train(cls, matrix, nlist, iterations=20, sample_size=100000, seed=0):
+        """在（采样后的）归一化向量上训练球面 k-means 聚类中心。"""
+        rng = np.random.default_rng(seed)
+        if len(matrix) > sample_size:
+            data = np.asarray(matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))], dtype=np.float32)
+        else:
+            data = np.asarray(matrix, dtype=np.float32)
+        nlist = max(1, min(nlist, len(data)))
+        centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = cls(centroids).assign(data)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, data)
+            counts = np.bincount(assignments, minlength=nlist)
+            empty = counts == 0
+            if empty.any():  # 空聚类重新随机取点
+                sums[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+        return cls(centroids)
+
+    @classmethod
+    def load(cls, db_path, **kwargs):
+        path = ann_index_path(db_path)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if 'assignments' in data:
+                kwargs.update(row_ids=data['row_ids'], assignments=data['assignments'])
+            return cls(data['centroids'], **kwargs)
+
+    def save(self, db_path):
+        path = ann_index_path(db_path)
+        arrays = {'centroids': self.centroids}
+        if self.assignments is not None:
+            arrays.update(row_ids=self.row_ids, assignments=self.assignments)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(path + '.tmp', path)
+        return path
+
+
+class GalleryIndex:
+    """
+    已知猫咪的常驻特征索引（只读，更新时生成新的索引对象）。
+    matrix 的每一行是一条归一化后的特征向量，row_names / row_ids 是与之平行的
+    猫咪名字和数据库 rowid 数组；signatures 记录每只猫所在行的变化标记（见 row_signature）。
+
+    matrix 也可以是 np.memmap（见 from_store），多个进程共享同一份页缓存。此时增量修改
+    不会复制基础矩阵：被删除或修改的行记入 alive 掩码，新增或修改后的向量放在内存中的 delta 索引里。
+
+    挂接 IVFIndex 后（见 with_ann），assignments 记录每行所属的聚类，增量修改时随行一起保留，
+    大图库查询只扫描被探测到的聚类；delta 始终精确搜索。
+    """
+
+    def __init__(self, matrix, row_names, row_ids, signatures, alive=None, delta=None,
+                 ivf=None, assignments=None):
+        self.matrix = matrix
+        self.row_names = row_names
+        self.row_ids = row_ids
+        self.signatures = signatures
+        self.alive = alive
+        self.delta = delta
+        self.ivf = ivf
+        self.assignments = assignments
+        self._inverted_lists = None
+
+    def __len__(self):
+        base = len(self.row_names) if self.alive is None else int(np.count_nonzero(self.alive))
+        return base + (len(self.delta) if self.delta is not None else 0)
+
+    @property
+    def is_mapped(self):
+        return isinstance(self.matrix, np.memmap)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=object),
+                   np.empty(0, dtype=np.int64), {})
+
+    @staticmethod
+    def _build_blocks(rows):
+        blocks, names, ids, signatures = [], [], [], {}
+        for rowid, name, vectors_blob, version in rows:
+            known_vectors = normalize_rows(deserialize_data(vectors_blob))
+            blocks.append(known_vectors)
+            names.extend([name] * len(known_vectors))
+            ids.extend([rowid] * len(known_vectors))
+            signatures[rowid] = row_signature(name, len(vectors_blob), version)
+        return blocks, names, ids, signatures
+
+    @classmethod
+    def from_rows(cls, rows):
+        """由 (rowid, name, feature_vectors_blob, version) 行构建索引。"""
+        blocks, names, ids, signatures = cls._build_blocks(rows)
+        if not blocks:
+            return cls.empty()
+        matrix = np.ascontiguousarray(np.concatenate(blocks), dtype=np.float32)
+        return cls(matrix, np.array(names, dtype=object), np.array(ids, dtype=np.int64), signatures)
+
+    @classmethod
+    def from_database(cls, db_path):
+        """从识别数据库读取所有猫咪并构建索引，数据库出错时抛出 sqlite3.Error。"""
+        conn = sqlite3.connect(db_path)
+        try:
+            ensure_row_versions(conn)
+            rows = conn.execute(f"SELECT {ROW_COLUMNS} FROM cats").fetchall()
+        finally:
+            conn.close()
+        index = cls.from_rows(rows)
+        logger.info(f"图库索引已加载: {len(rows)} 只猫, {len(index)} 条特征向量")
+        return index
+
+    @classmethod
+    def from_store(cls, db_path):
+        """以只读内存映射方式打开 export-mmap 生成的图库文件，不存在时返回 None。"""
+        matrix_path, labels_path = store_paths(db_path)
+        if not (os.path.exists(matrix_path) and os.path.exists(labels_path)):
+            return None
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            labels = json.load(f)
+        if labels.get('version') != STORE_FORMAT_VERSION:
+            raise ValueError(f"图库文件格式过旧: {labels_path}，请重新运行 export-mmap")
+        matrix = np.load(matrix_path, mmap_mode='r')
+        cats = labels['cats']  # [[rowid, name, blob_size, vector_count, version], ...]，顺序与矩阵行一致
+        counts = np.array([cat[3] for cat in cats], dtype=np.int64)
+        row_ids = np.repeat(np.array([cat[0] for cat in cats], dtype=np.int64), counts)
+        row_names = np.repeat(np.array([cat[1] for cat in cats], dtype=object), counts)
+        signatures = {cat[0]: row_signature(cat[1], cat[2], cat[4]) for cat in cats}
+        if len(row_ids) != len(matrix):
+            raise ValueError(f"图库文件不一致: {matrix_path} 有 {len(matrix)} 行，标签有 {len(row_ids)} 行")
+        logger.info(f"图库索引已从内存映射文件加载: {len(cats)} 只猫, {len(matrix)} 条特征向量")
+        return cls(matrix, row_names, row_ids, signatures)
+
+    def save_store(self, db_path):
+        """把索引写成 .npy 矩阵 + 标签文件，先写临时文件再原子替换。"""
+        if self.alive is not None or self.delta is not None:
+            raise ValueError("只能导出完整构建的索引")
+        matrix_path, labels_path = store_paths(db_path)
+        cats = []
+        for start in range(len(self.row_ids)):
+            rowid = int(self.row_ids[start])
+            if cats and cats[-1][0] == rowid:
+                cats[-1][3] += 1
+            else:
+                cats.append([rowid, self.row_names[start], self.signatures[rowid][1], 1, self.signatures[rowid][2]])
+        with open(matrix_path + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.matrix, dtype=np.float32))
+        with open(labels_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'version': STORE_FORMAT_VERSION,
+                       'dim': int(self.matrix.shape[1]) if self.matrix.size else 0, 'cats': cats},
+                      f, ensure_ascii=False)
+        os.replace(matrix_path + '.tmp', matrix_path)
+        os.replace(labels_path + '.tmp', labels_path)
+        return matrix_path, labels_path
+
+    def with_ann(self, ivf):
+        """
+        返回挂接了 IVF 索引的新索引，ivf 为 None 时原样返回。
+        图库行序与 build-ann 时一致则直接复用保存的聚类编号，否则为每一行重新计算。
+        """
+        if ivf is None:
+            return self
+        if len(self.row_ids) and self.matrix.shape[1] != ivf.centroids.shape[1]:
+            logger.error(f"IVF 索引维度 {ivf.centroids.shape[1]} 与图库维度 {self.matrix.shape[1]} 不一致，已忽略")
+            return self
+        if ivf.assignments is not None and np.array_equal(ivf.row_ids, self.row_ids):
+            assignments = np.asarray(ivf.assignments, dtype=np.int32)
+        elif len(self.row_ids):
+            logger.info("图库与 IVF 索引构建时不一致，重新计算每行的聚类（建议重新运行 build-ann）")
+            assignments = ivf.assign(self.matrix)
+        else:
+            assignments = np.empty(0, dtype=np.int32)
+        return GalleryIndex(self.matrix, self.row_names, self.row_ids, self.signatures,
+                            self.alive, self.delta, ivf, assignments)
+
+    def _candidate_rows(self, query):
+        """IVF 探测到的候选行号；图库较小或未挂接 IVF 时返回 None，表示精确搜索。"""
+        if self.ivf is None or len(self.row_ids) < self.ivf.min_vectors:
+            return None
+        if self._inverted_lists is None:
+            order = np.argsort(self.assignments, kind='stable')
+            offsets = np.searchsorted(self.assignments[order], np.arange(self.ivf.nlist + 1))
+            self._inverted_lists = (order, offsets)
+        order, offsets = self._inverted_lists
+        return np.concatenate([order[offsets[l]:offsets[l + 1]] for l in self.ivf.probe(query)])
+
+    def with_changes(self, changed_rows, removed_ids):
+        """
+        返回应用增量修改后的新索引，自身保持不变。
+        changed_rows 为新增或修改的 (rowid, name, blob, version) 行，只有这些行会被重新反序列化；
+        其余行直接复用已归一化的矩阵数据。
+        """
+        stale_ids = set(removed_ids) | {row[0] for row in changed_rows}
+        stale = np.isin(self.row_ids, list(stale_ids)) if stale_ids else np.zeros(len(self.row_ids), dtype=bool)
+
+        if self.is_mapped:
+            # 内存映射的基础矩阵保持不动，只更新掩码和内存中的 delta
+            alive = ~stale if self.alive is None else self.alive & ~stale
+            delta = (self.delta or GalleryIndex.empty()).with_changes(changed_rows, removed_ids)
+            signatures = {rowid: s for rowid, s in self.signatures.items() if rowid not in stale_ids}
+            signatures.update((rowid, row_signature(name, len(blob), version))
+                              for rowid, name, blob, version in changed_rows)
+            return GalleryIndex(self.matrix, self.row_names, self.row_ids, signatures, alive, delta,
+                                self.ivf, self.assignments)
+
+        keep = ~stale
+        blocks, names, ids, new_signatures = self._build_blocks(changed_rows)
+        kept_blocks = [self.matrix[keep]] if keep.any() else []
+        all_blocks = kept_blocks + blocks
+        signatures = {rowid: s for rowid, s in self.signatures.items() if rowid not in stale_ids}
+        signatures.update(new_signatures)
+        if not all_blocks:
+            index = GalleryIndex.empty()
+            index.signatures = signatures
+            index.ivf = self.ivf
+            index.assignments = np.empty(0, dtype=np.int32) if self.ivf is not None else None
+            return index
+        matrix = np.ascontiguousarray(np.concatenate(all_blocks), dtype=np.float32)
+        row_names = np.concatenate([self.row_names[keep], np.array(names, dtype=object)])
+        row_ids = np.concatenate([self.row_ids[keep], np.array(ids, dtype=np.int64)])
+        assignments = None
+        if self.ivf is not None:
+            # 保留行沿用已有的聚类编号，只为新向量计算
+            new_assignments = [self.ivf.assign(block) for block in blocks]
+            assignments = np.concatenate([self.assignments[keep]] + new_assignments).astype(np.int32)
+        return GalleryIndex(matrix, row_names, row_ids, signatures, ivf=self.ivf, assignments=assignments)
+
+    def search(self, query_vector):
+        """返回 (最相似的猫名, 相似度, 错误信息)，与 find_most_similar_cat 的约定一致。"""
+        if len(self) == 0:
+            return None, -1.0, "数据库为空"
+        query = normalize_rows(query_vector)[0]
+        best_name, best_similarity = None, -np.inf
+        if len(self.row_ids):
+            candidates = self._candidate_rows(query)
+            if candidates is None:
+                rows = slice(None)
+                similarities = self.matrix @ query
+            else:
+                rows = candidates
+                similarities = self.matrix[candidates] @ query
+            if self.alive is not None:
+                similarities = np.where(self.alive[rows], similarities, -np.inf)
+            best = int(np.argmax(similarities)) if len(similarities) else None
+            if best is not None and np.isfinite(similarities[best]):
+                row = best if candidates is None else int(candidates[best])
+                best_name, best_similarity = self.row_names[row], float(similarities[best])
+        if self.delta is not None and len(self.delta):
+            name, similarity, _ = self.delta.search(query)
+            if similarity > best_similarity:
+                best_name, best_similarity = name, similarity
+        return best_name, best_similarity, None
+
+
+class GalleryWatcher:
+    """
+    监视识别数据库的变化，并把增量修改应用到常驻图库索引。
+    通过文件 (inode, mtime, size) 和 PRAGMA data_version 判断数据库是否被修改，
+    新索引构建完成后整体替换 current 引用，正在进行的查询始终看到完整的索引。
+    use_store=True 时优先以内存映射方式打开 export-mmap 导出的图库文件，再补上导出之后的修改。
+    ivf 为 build-ann 生成的 IVFIndex（可为 None），加载的索引会自动挂接它。
+    """
+
+    def __init__(self, db_path, interval=2.0, use_store=False, ivf=None):
+        self.db_path = db_path
+        self.interval = interval
+        self.use_store = use_store
+        self.ivf = ivf
+        self.current = None
+        self.load_error = None
+        self.reload_count = 0
+        self._conn = None
+        self._file_state = None
+        self._data_version = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _stat_files(self):
+        state = []
+        for path in (self.db_path, self.db_path + '-wal'):
+            try:
+                st = os.stat(path)
+                state.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except OSError:
+                state.append(None)
+        return tuple(state)
+
+    def _connect(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        ensure_row_versions(self._conn)
+
+    def _load_store(self):
+        try:
+            return GalleryIndex.from_store(self.db_path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"无法打开内存映射图库文件，改为从数据库加载: {e}")
+            return None
+
+    def load(self):
+        """完整加载一次图库（仅在启动或此前加载失败时使用）。"""
+        store = self._load_store() if self.use_store else None
+        if store is not None:
+            with self._lock:
+                try:
+                    self._connect()
+                except sqlite3.Error as e:
+                    self.load_error = f"数据库错误: {e}"
+                    logger.error(f"无法打开图库数据库 {self.db_path}: {e}")
+                    return self.current
+                self._file_state = None
+                self._data_version = None
+                self.current = store.with_ann(self.ivf)
+                self.load_error = None
+            self.refresh()  # 只把导出之后的数据库修改应用到 delta
+            return self.current
+
+        with self._lock:
+            try:
+                self._connect()
+                self._file_state = self._stat_files()
+                self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                rows = self._conn.execute(f"SELECT {ROW_COLUMNS} FROM cats").fetchall()
+                self.current = GalleryIndex.from_rows(rows).with_ann(self.ivf)
+                self.load_error = None
+                logger.info(f"图库索引已加载: {len(rows)} 只猫, {len(self.current)} 条特征向量")
+            except sqlite3.Error as e:
+                self.load_error = f"数据库错误: {e}"
+                logger.error(f"无法加载图库数据库 {self.db_path}: {e}")
+        return self.current
+
+    def _fetch_rows(self, rowids, chunk_size=500):
+        rows = []
+        for start in range(0, len(rowids), chunk_size):
+            chunk = rowids[start:start + chunk_size]
+            rows.extend(self._conn.execute(
+                f"SELECT {ROW_COLUMNS} FROM cats WHERE rowid IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchall())
+        return rows
+
+    def refresh(self):
+        """检查数据库是否变化，若变化则只把新增/修改/删除的行应用到索引。返回是否发生了更新。"""
+        if self.current is None:
+            return self.load() is not None
+
+        with self._lock:
+            file_state = self._stat_files()
+            inode = file_state[0][0] if file_state[0] else None
+            old_inode = self._file_state[0][0] if self._file_state and self._file_state[0] else None
+            try:
+                if inode != old_inode:
+                    # 数据库文件被替换（inode 变化），需要重新打开连接
+                    self._connect()
+                    self._data_version = None
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+                if file_state == self._file_state and data_version == self._data_version:
+                    return False
+
+                old = self.current
+                stale_ids = []
+                seen_ids = set()
+                # 只读名字、BLOB 长度和行版本，不读特征数据；标记变化的行再单独取出
+                for rowid, name, blob_size, version in self._conn.execute(
+                        "SELECT rowid, name, length(feature_vectors), version FROM cats"):
+                    seen_ids.add(rowid)
+                    if old.signatures.get(rowid) != row_signature(name, blob_size, version):
+                        stale_ids.append(rowid)
+                removed_ids = set(old.signatures) - seen_ids
+                changed_rows = self._fetch_rows(stale_ids)
+            except sqlite3.Error as e:
+                logger.error(f"检查图库数据库变化失败: {e}")
+                return False
+
+            self._file_state = file_state
+            self._data_version = data_version
+            if not changed_rows and not removed_ids:
+                return False
+
+            self.current = old.with_changes(changed_rows, removed_ids)
+            self.reload_count += 1
+            logger.info(f"图库索引已增量更新: {len(changed_rows)} 只猫新增/修改, "
+                        f"{len(removed_ids)} 只猫删除, 当前 {len(self.current)} 条特征向量")
+            return True
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"图库热更新线程发生错误: {e}", exc_info=True)
+
+    def start(self):
+        """启动后台轮询线程。"""
+        self._thread = threading.Thread(target=self._run, name='gallery-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# --- 命令行工具 ---
+
+def migrate_database(db_path, dtype='float32', dry_run=False):
+    """把数据库中旧的 pickle 格式 feature_vectors 一次性转换为紧凑二进制格式。"""
+    conn = sqlite3.connect(db_path)
+    try:
+        ensure_row_versions(conn)  # 迁移改写的行会得到新版本，运行中的识别服务器据此增量更新
+        rows = conn.execute("SELECT rowid, name, feature_vectors FROM cats").fetchall()
+        legacy = [(rowid, name, blob) for rowid, name, blob in rows if is_legacy_blob(blob)]
+        print(f"📦 共 {len(rows)} 只猫，其中 {len(legacy)} 只仍为旧的 pickle 格式。")
+        if dry_run or not legacy:
+            return len(legacy)
+        old_bytes = new_bytes = 0
+        with conn:
+            for rowid, name, blob in legacy:
+                new_blob = serialize_vectors(deserialize_data(blob), dtype=dtype)
+                conn.execute("UPDATE cats SET feature_vectors = ? WHERE rowid = ?", (new_blob, rowid))
+                old_bytes += len(blob)
+                new_bytes += len(new_blob)
+        print(f"✅ 已迁移 {len(legacy)} 只猫 ({dtype})，特征数据 {old_bytes} -> {new_bytes} 字节。")
+        return len(legacy)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='猫咪识别图库维护工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate = subparsers.add_parser('migrate', help='把 pickle 格式的 feature_vectors 迁移为紧凑二进制格式')
+    migrate.add_argument('--db', default=DEFAULT_DATABASE_FILE, help='识别数据库路径')
+    migrate.add_argument('--dtype', choices=sorted(EMBEDDING_DTYPE_CODES), default='float32')
+    migrate.add_argument('--dry-run', action='store_true', help='只统计不写入')
+
+    export = subparsers.add_parser('export-mmap', help='导出可内存映射的图库文件 (.npy + 标签)，供识别服务器共享加载')
+    export.add_argument('--db', default=DEFAULT_DATABASE_FILE, help='识别数据库路径')
+
+    build_ann = subparsers.add_parser('build-ann', help='离线训练 IVF 近似最近邻索引（含每行的聚类编号），写入数据库旁的 .ivf.npz')
+    build_ann.add_argument('--db', default=DEFAULT_DATABASE_FILE, help='识别数据库路径')
+    build_ann.add_argument('--nlist', type=int, default=None, help='聚类数，默认约为 4*sqrt(向量数)')
+    build_ann.add_argument('--iterations', type=int, default=20)
+
+    args = parser.parse_args(argv)
+    if args.command == 'migrate':
+        migrate_database(args.db, dtype=args.dtype, dry_run=args.dry_run)
+    elif args.command == 'export-mmap':
+        index = GalleryIndex.from_database(args.db)
+        matrix_path, labels_path = index.save_store(args.db)
+        print(f"✅ 已导出 {len(index)} 条特征向量: {matrix_path}, {labels_path}")
+    elif args.command == 'build-ann':
+        # 已导出内存映射文件时按它的行序保存聚类编号，识别服务器加载后可直接复用
+        try:
+            index = GalleryIndex.from_store(args.db)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ 无法打开内存映射图库文件，改为从数据库读取: {e}")
+            index = None
+        index = index or GalleryIndex.from_database(args.db)
+        if len(index) == 0:
+            print("❌ 图库为空，无法训练 IVF 索引。")
+            return
+        nlist = args.nlist or max(1, int(4 * np.sqrt(len(index))))
+        ivf = IVFIndex.train(index.matrix, nlist, iterations=args.iterations)
+        ivf.row_ids = index.row_ids
+        ivf.assignments = ivf.assign(index.matrix)
+        path = ivf.save(args.db)
+        print(f"✅ 已训练 {ivf.nlist} 个聚类的 IVF 索引 ({len(index)} 条特征向量): {path}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
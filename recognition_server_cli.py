@@ -6,11 +6,14 @@
 
 import os
 import uuid
+import hashlib
 import logging
 import threading
 import queue
 import time
 import sys
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 
 from flask import Flask, request, jsonify
 from werkzeug.utils import secure_filename
@@ -23,8 +26,8 @@ import torchvision.transforms as transforms
 from ultralytics import YOLO
 import numpy as np
 import sqlite3
-import pickle
-from scipy.spatial.distance import cosine
+
+from cat_gallery import GalleryWatcher, IVFIndex
 
 # --- 1. 配置区域 ---
 
@@ -32,11 +35,34 @@ from scipy.spatial.distance import cosine
 UPLOAD_FOLDER = 'temp_recognition'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 SERVER_PORT = 2255
+# 上传图片默认直接在内存中解码；设置为字节数后，超过该大小的请求体先落盘再由 worker 读取
+SPILL_TO_DISK_BYTES = None
 
 # AI模型与数据库配置
 DATABASE_FILE = '../cats_recognition.db'
 YOLO_MODEL_PATH = '../models/best.pt'
+FEATURE_EXTRACTOR_WEIGHTS = models.MobileNet_V2_Weights.DEFAULT
 SIMILARITY_THRESHOLD = 0.80  # 关键阈值：高于此值才确认为已知猫咪
+GALLERY_RELOAD_INTERVAL = 2.0  # 检查识别数据库变化的间隔（秒）
+GALLERY_USE_MMAP = True  # 存在 cat_gallery.py export-mmap 导出的文件时，以内存映射方式共享加载
+# 近似最近邻：存在 cat_gallery.py build-ann 生成的索引时启用；ANN_NPROBE 越大召回越高、延迟越大
+ANN_NPROBE = 8
+ANN_MIN_VECTORS = 20000  # 向量数少于该值时仍使用精确搜索
+
+# 批量推理配置：攒够 MAX_BATCH_SIZE 张图片或等待 MAX_BATCH_WAIT 秒后一起推理
+MAX_BATCH_SIZE = 16
+MAX_BATCH_WAIT = 0.02
+RECOGNITION_TIMEOUT = 30  # 单次识别请求最长等待时间（秒）
+MAX_BATCH_REQUEST_IMAGES = 64  # /recognize_batch 单次请求最多接受的图片数
+
+# 特征缓存：按图片内容哈希缓存检测框和特征向量，重复图片直接跳过 YOLO 和 MobileNet
+EMBEDDING_CACHE_BYTES = 64 * 1024 * 1024
+EMBEDDING_CACHE_DB = None  # 设置为文件路径（如 'embedding_cache.db'）后缓存会持久化到 SQLite
+
+# 识别工作线程池：每个 worker 持有独立的模型实例，并平分可用的 CPU 核心
+CPU_CORES = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+RECOGNITION_WORKERS = int(os.environ.get('RECOGNITION_WORKERS', max(1, min(4, len(CPU_CORES) // 2))))
+PIN_WORKER_CORES = os.environ.get('PIN_WORKER_CORES', '1') != '0'  # 是否把每个 worker 绑定到各自的核心上
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -56,7 +82,7 @@ def load_ai_models():
         print(f"   - 错误: 无法加载YOLOv8模型 at {YOLO_MODEL_PATH}. Error: {e}")
         return None, None
 
-    extractor = models.mobilenet_v2(weights=models.MobileNet_V2_Weights.DEFAULT)
+    extractor = models.mobilenet_v2(weights=FEATURE_EXTRACTOR_WEIGHTS)
     extractor.classifier[1] = torch.nn.Identity()
     extractor.eval()
     print("   - MobileNetV2 特征提取器加载成功。")
@@ -70,54 +96,196 @@ preprocess_transform = transforms.Compose([
 ])
 
 
-def extract_feature_from_image(image_path, yolo_model, feature_extractor):
-    """从图片中提取特征向量。"""
-    img = cv2.imread(image_path)
-    if img is None: return None
-    results = yolo_model.predict(source=img, verbose=False, conf=0.5)
-    best_box = None;
-    max_conf = 0
-    if results[0].boxes:
-        for box in results[0].boxes:
-            if box.conf > max_conf: max_conf = box.conf; best_box = box.xyxy[0].cpu().numpy().astype(int)
-    if best_box is not None:
-        x1, y1, x2, y2 = best_box
-        cropped_face = img[y1:y2, x1:x2]
-        if cropped_face.size == 0: return None
-        rgb_image = cv2.cvtColor(cropped_face, cv2.COLOR_BGR2RGB)
-        input_tensor = preprocess_transform(rgb_image)
-        input_batch = input_tensor.unsqueeze(0)
-        with torch.no_grad():
-            feature_vector = feature_extractor(input_batch)
-        return feature_vector.squeeze().cpu().numpy()
-    return None
+def content_hash(data):
+    """图片内容的 SHA-256 哈希，作为特征缓存的键。"""
+    return hashlib.sha256(data).hexdigest()
 
 
-def deserialize_data(data_blob):
-    return pickle.loads(data_blob)
+def hash_file(path, chunk_size=1024 * 1024):
+    """分块计算文件内容的 SHA-256 哈希。"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
-def find_most_similar_cat(query_vector, db_path):
-    """在数据库中搜索最相似的猫。"""
+def model_fingerprint():
+    """YOLO 权重文件内容 + 特征提取器名称的指纹，任一变化时特征缓存必须失效。"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name, feature_vectors FROM cats")
-        all_cats = cursor.fetchall()
-        conn.close()
-    except sqlite3.Error as e:
-        return None, -1.0, f"数据库错误: {e}"
-    if not all_cats: return None, -1.0, "数据库为空"
-    best_match_name = None;
-    highest_similarity = -1.0
-    for name, vectors_blob in all_cats:
-        known_vectors = deserialize_data(vectors_blob)
-        similarities = [1 - cosine(query_vector, vec) for vec in known_vectors]
-        max_sim_for_this_cat = np.max(similarities)
-        if max_sim_for_this_cat > highest_similarity:
-            highest_similarity = max_sim_for_this_cat
-            best_match_name = name
-    return best_match_name, highest_similarity, None
+        yolo_hash = hash_file(YOLO_MODEL_PATH)
+    except OSError:
+        yolo_hash = f"missing:{YOLO_MODEL_PATH}"
+    return hashlib.sha256(f"{yolo_hash}|mobilenet_v2:{FEATURE_EXTRACTOR_WEIGHTS}".encode('utf-8')).hexdigest()[:16]
+
+
+class EmbeddingCache:
+    """
+    以图片内容哈希为键的特征缓存，缓存值为 (检测框, 特征向量)，未检测到猫脸时两者均为 None。
+    内存中按 LRU 淘汰并限制总字节数；可选地写入 SQLite 以便重启后继续命中。
+    SQLite 中同时记录生成缓存的模型指纹 (model_fingerprint)，启动时指纹不同则清空旧缓存。
+    """
+    ENTRY_OVERHEAD = 256  # 每条缓存的键和对象开销估算
+
+    def __init__(self, max_bytes, db_path=None, fingerprint=None):
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache (hash TEXT PRIMARY KEY, box BLOB, feature BLOB)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache_meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = self._conn.execute(
+                "SELECT value FROM embedding_cache_meta WHERE key = 'model_fingerprint'").fetchone()
+            if row is None or row[0] != fingerprint:
+                if row is not None:
+                    logger.info(f"模型已变化 ({row[0]} -> {fingerprint})，清空持久化的特征缓存")
+                self._conn.execute("DELETE FROM embedding_cache")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embedding_cache_meta (key, value) VALUES ('model_fingerprint', ?)",
+                    (fingerprint,))
+            self._conn.commit()
+
+    @classmethod
+    def _entry_bytes(cls, box, feature):
+        size = cls.ENTRY_OVERHEAD
+        if box is not None: size += box.nbytes
+        if feature is not None: size += feature.nbytes
+        return size
+
+    def _remember(self, key, entry):
+        if key in self._entries:
+            self.current_bytes -= self._entry_bytes(*self._entries.pop(key))
+        self._entries[key] = entry
+        self.current_bytes += self._entry_bytes(*entry)
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= self._entry_bytes(*evicted)
+
+    def get(self, key):
+        """返回 (box, feature)；缓存未命中时返回 None。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if self._conn is not None:
+                row = self._conn.execute("SELECT box, feature FROM embedding_cache WHERE hash = ?", (key,)).fetchone()
+                if row is not None:
+                    box = np.frombuffer(row[0], dtype=np.int32) if row[0] is not None else None
+                    feature = np.frombuffer(row[1], dtype=np.float32) if row[1] is not None else None
+                    entry = (box, feature)
+                    self._remember(key, entry)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, key, box, feature):
+        box = np.asarray(box, dtype=np.int32) if box is not None else None
+        feature = np.asarray(feature, dtype=np.float32) if feature is not None else None
+        with self._lock:
+            self._remember(key, (box, feature))
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embedding_cache (hash, box, feature) VALUES (?, ?, ?)",
+                    (key, box.tobytes() if box is not None else None,
+                     feature.tobytes() if feature is not None else None))
+                self._conn.commit()
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.current_bytes, 'fingerprint': self.fingerprint,
+                'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+EMBEDDING_CACHE = EmbeddingCache(EMBEDDING_CACHE_BYTES, EMBEDDING_CACHE_DB,
+                                 fingerprint=model_fingerprint() if EMBEDDING_CACHE_DB else None)
+
+
+def detect_best_boxes(images, yolo_model):
+    """对一批图片运行一次 YOLO，返回每张图片置信度最高的猫脸框（未检测到则为 None）。"""
+    results = yolo_model.predict(source=images, verbose=False, conf=0.5)
+    best_boxes = []
+    for result in results:
+        best_box = None
+        max_conf = 0
+        if result.boxes:
+            for box in result.boxes:
+                if box.conf > max_conf: max_conf = box.conf; best_box = box.xyxy[0].cpu().numpy().astype(int)
+        best_boxes.append(best_box)
+    return best_boxes
+
+
+def extract_features_batch(images, yolo_model, feature_extractor, cache_keys=None):
+    """
+    批量提取特征向量：YOLO 一次处理整批图片，MobileNetV2 一次处理堆叠后的裁剪张量。
+    提供 cache_keys（图片内容哈希）时，命中特征缓存的图片不再经过任何模型。
+    返回与 images 等长的列表，图片无效或未检测到猫脸的位置为 None。
+    """
+    features = [None] * len(images)
+    cache_keys = cache_keys or [None] * len(images)
+    valid = []
+    for i, (img, key) in enumerate(zip(images, cache_keys)):
+        cached = EMBEDDING_CACHE.get(key) if key else None
+        if cached is not None:
+            features[i] = cached[1]
+        elif img is not None:
+            valid.append((i, img))
+    if not valid:
+        return features
+
+    best_boxes = detect_best_boxes([img for _, img in valid], yolo_model)
+    tensors, owners = [], []
+    for (i, img), best_box in zip(valid, best_boxes):
+        cropped_face = None
+        if best_box is not None:
+            x1, y1, x2, y2 = best_box
+            cropped_face = img[y1:y2, x1:x2]
+        if cropped_face is None or cropped_face.size == 0:
+            if cache_keys[i]: EMBEDDING_CACHE.put(cache_keys[i], None, None)
+            continue
+        rgb_image = cv2.cvtColor(cropped_face, cv2.COLOR_BGR2RGB)
+        tensors.append(preprocess_transform(rgb_image))
+        owners.append((i, best_box))
+
+    if tensors:
+        with torch.no_grad():
+            feature_vectors = feature_extractor(torch.stack(tensors))
+        for (i, best_box), feature_vector in zip(owners, feature_vectors.cpu().numpy()):
+            features[i] = feature_vector
+            if cache_keys[i]: EMBEDDING_CACHE.put(cache_keys[i], best_box, feature_vector)
+    return features
+
+
+def load_gallery(db_path):
+    """一次性把数据库中所有已知猫咪的特征向量加载为常驻索引，之后只做增量热更新。"""
+    print("📚 正在加载已知猫咪图库...")
+    ivf = IVFIndex.load(db_path, nprobe=ANN_NPROBE, min_vectors=ANN_MIN_VECTORS)
+    if ivf is not None:
+        print(f"   - 已加载 IVF 近似最近邻索引 ({ivf.nlist} 个聚类, nprobe={ANN_NPROBE})。")
+    gallery = GalleryWatcher(db_path, interval=GALLERY_RELOAD_INTERVAL, use_store=GALLERY_USE_MMAP, ivf=ivf)
+    index = gallery.load()
+    if index is None:
+        print(f"   - 错误: 无法读取图库数据库 {db_path}. Error: {gallery.load_error}")
+    else:
+        print(f"   - 图库加载成功，共 {len(index)} 条特征向量。")
+    return gallery
+
+
+def find_most_similar_cat(query_vector):
+    """在常驻图库索引中搜索最相似的猫。"""
+    index = GALLERY.current  # 只取一次引用，热更新时整体替换，不会读到半成品
+    if index is None:
+        return None, -1.0, GALLERY.load_error
+    return index.search(query_vector)
 
 
 # --- 3. Flask服务器与工作线程 ---
@@ -125,92 +293,258 @@ def find_most_similar_cat(query_vector, db_path):
 app = Flask(__name__)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# 识别队列和结果字典
+
+
+class RecognitionTask:
+    """
+    队列中的一个识别任务。
+    结果通过 future 直接交付给等待的请求线程；请求超时后 future 被取消，
+    worker 会跳过它，结果也随任务对象一起被回收，不会残留在任何共享结构中。
+    """
+    __slots__ = ('task_id', 'image', 'image_path', 'content_hash', 'filename', 'future')
+
+    def __init__(self, filename, image=None, image_path=None, content_hash=None):
+        self.task_id = str(uuid.uuid4())
+        self.image = image  # 已解码的 BGR ndarray
+        self.image_path = image_path  # 仅在大文件落盘时使用
+        self.content_hash = content_hash  # 图片内容哈希，用于特征缓存
+        self.filename = filename
+        self.future = Future()
+
+    def load_image(self):
+        if self.image is None and self.image_path:
+            self.image = cv2.imread(self.image_path)
+        return self.image
+
+
+# 识别队列（元素为 RecognitionTask，None 为退出信号）
 recognition_queue = queue.Queue()
-recognition_results = {}
 
-# 全局加载AI模型
-YOLO_MODEL, FEATURE_EXTRACTOR = load_ai_models()
-if not YOLO_MODEL:
+# 全局加载AI模型（每个 worker 一份，避免多线程共享同一个模型实例）
+WORKER_MODELS = [load_ai_models() for _ in range(RECOGNITION_WORKERS)]
+if not all(yolo for yolo, _ in WORKER_MODELS):
     print("关键AI模型加载失败，服务器无法启动。")
     sys.exit(1)
 
-
-def ai_recognition_worker():
+# 全局加载已知猫咪图库
+GALLERY = load_gallery(DATABASE_FILE)
+
+
+def build_recognition_result(task_id, filename, query_vector):
+    """根据查询向量在图库中匹配，并生成返回给前端的结果字典。"""
+    if query_vector is None:
+        logger.warning(f"任务 {task_id}: 未能在图片 {filename} 中检测到猫脸。")
+        return {'error': 'face_not_detected'}
+
+    # 在数据库中匹配
+    cat_name, similarity, db_error = find_most_similar_cat(query_vector)
+
+    if db_error:
+        logger.error(f"任务 {task_id}: {db_error}")
+        return {'error': db_error}
+
+    # 根据置信度给出不同的提示词
+    # 这是我们实现新需求的核心逻辑
+    if similarity >= SIMILARITY_THRESHOLD:
+        status = "matched"
+        message = f"识别成功！这很可能是 {cat_name}。"
+        if similarity > 0.85:
+            message += " (置信度: 非常高)"
+        elif similarity > 0.75:
+            message += " (置信度: 较高)"
+        else:
+            message += " (置信度: 可信)"
+        result_name = cat_name
+    else:
+        status = "unmatched"
+        message = f"未在数据库中找到足够相似的猫。最接近的是 {cat_name} (相似度 {similarity:.2f})，但未达到阈值 {SIMILARITY_THRESHOLD}。"
+        result_name = "待定 (Unknown)"  # 低于阈值，显示为待定
+
+    return {
+        'status': status,
+        'cat_name': result_name,
+        'similarity': float(f"{similarity:.4f}"),
+        'message': message,
+        'matched_cat': cat_name if similarity >= SIMILARITY_THRESHOLD else None
+    }
+
+
+def collect_batch():
+    """阻塞等待第一个任务，然后在 MAX_BATCH_WAIT 内继续收集，最多 MAX_BATCH_SIZE 个。"""
+    batch = [recognition_queue.get()]
+    deadline = time.monotonic() + MAX_BATCH_WAIT
+    while len(batch) < MAX_BATCH_SIZE and batch[-1] is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(recognition_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+class WorkerStats:
+    """单个识别 worker 的运行统计，用于 /status 报告利用率。"""
+
+    def __init__(self, worker_id, cpu_cores):
+        self.worker_id = worker_id
+        self.cpu_cores = cpu_cores
+        self.started_at = time.monotonic()
+        self.busy_seconds = 0.0
+        self.batches = 0
+        self.tasks = 0
+        self.busy = False
+
+    def to_dict(self):
+        uptime = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            'worker_id': self.worker_id,
+            'cpu_cores': self.cpu_cores,
+            'busy': self.busy,
+            'batches': self.batches,
+            'tasks': self.tasks,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'utilization': round(self.busy_seconds / uptime, 4),
+        }
+
+
+def partition_cores(worker_count):
+    """把可用核心尽量平均地分给各个 worker（worker 多于核心时轮流共享）。"""
+    if worker_count > len(CPU_CORES):
+        return [[CPU_CORES[i % len(CPU_CORES)]] for i in range(worker_count)]
+    return [CPU_CORES[i::worker_count] for i in range(worker_count)]
+
+
+def ai_recognition_worker(stats, yolo_model, feature_extractor):
     """
     全自动AI识别工作线程。
-    它会从队列中获取任务，调用AI模型进行识别，并将结果存入字典。
+    它会从共享队列中批量获取任务，整批调用本 worker 自己的AI模型进行识别，并通过各任务的 future 发布结果。
     """
-    print("✅ AI识别工作线程已启动，等待处理任务...")
-    while True:
+    if PIN_WORKER_CORES and hasattr(os, 'sched_setaffinity'):
         try:
-            task_id, image_path, filename = recognition_queue.get()
-            if task_id is None: break  # 退出信号
-
-            logger.info(f"开始处理任务 {task_id} ({filename})...")
+            os.sched_setaffinity(0, stats.cpu_cores)  # Linux 下只作用于当前线程，之后创建的计算线程会继承
+        except OSError as e:
+            logger.warning(f"worker {stats.worker_id} 绑定核心失败: {e}")
+
+    print(f"✅ AI识别工作线程 #{stats.worker_id} 已启动 (核心 {stats.cpu_cores})，等待处理任务...")
+    running = True
+    while running:
+        batch = collect_batch()
+        started = time.monotonic()
+        stats.busy = True
+        tasks = []
+        for task in batch:
+            if task is None:
+                running = False  # 退出信号，处理完本批后退出
+            elif task.future.set_running_or_notify_cancel():
+                tasks.append(task)  # 已超时取消的任务直接跳过
 
-            # 1. 提取查询向量
-            query_vector = extract_feature_from_image(image_path, YOLO_MODEL, FEATURE_EXTRACTOR)
-
-            if query_vector is None:
-                logger.warning(f"任务 {task_id}: 未能在图片 {filename} 中检测到猫脸。")
-                recognition_results[task_id] = {'error': 'face_not_detected'}
+        try:
+            if not tasks:
                 continue
+            logger.info(f"worker #{stats.worker_id} 开始批量处理 {len(tasks)} 个任务...")
 
-            # 2. 在数据库中匹配
-            cat_name, similarity, db_error = find_most_similar_cat(query_vector, DATABASE_FILE)
-
-            if db_error:
-                logger.error(f"任务 {task_id}: {db_error}")
-                recognition_results[task_id] = {'error': db_error}
-                continue
+            # 1. 批量提取查询向量
+            images = [task.load_image() for task in tasks]
+            query_vectors = extract_features_batch(images, yolo_model, feature_extractor,
+                                                   [task.content_hash for task in tasks])
 
-            # 3. 根据置信度给出不同的提示词
-            # 这是我们实现新需求的核心逻辑
-            if similarity >= SIMILARITY_THRESHOLD:
-                status = "matched"
-                message = f"识别成功！这很可能是 {cat_name}。"
-                if similarity > 0.85:
-                    message += " (置信度: 非常高)"
-                elif similarity > 0.75:
-                    message += " (置信度: 较高)"
-                else:
-                    message += " (置信度: 可信)"
-                result_name = cat_name
-            else:
-                status = "unmatched"
-                message = f"未在数据库中找到足够相似的猫。最接近的是 {cat_name} (相似度 {similarity:.2f})，但未达到阈值 {SIMILARITY_THRESHOLD}。"
-                result_name = "待定 (Unknown)"  # 低于阈值，显示为待定
-
-            # 4. 将包含丰富信息的结果存入字典
-            recognition_results[task_id] = {
-                'status': status,
-                'cat_name': result_name,
-                'similarity': float(f"{similarity:.4f}"),
-                'message': message,
-                'matched_cat': cat_name if similarity >= SIMILARITY_THRESHOLD else None
-            }
+            # 2. 逐个匹配，并立即唤醒等待该任务的请求线程
+            for task, query_vector in zip(tasks, query_vectors):
+                try:
+                    result = build_recognition_result(task.task_id, task.filename, query_vector)
+                except Exception as e:
+                    logger.error(f"任务 {task.task_id} 匹配时发生错误: {e}", exc_info=True)
+                    result = {'error': 'worker_exception'}
+                task.future.set_result(result)
 
         except Exception as e:
             logger.error(f"AI工作线程发生严重错误: {e}", exc_info=True)
             # 确保即使出错也能给前端一个响应
-            if 'task_id' in locals() and task_id not in recognition_results:
-                recognition_results[task_id] = {'error': 'worker_exception'}
+            for task in tasks:
+                if not task.future.done():
+                    task.future.set_result({'error': 'worker_exception'})
         finally:
-            # 清理临时文件
-            if 'image_path' in locals() and os.path.exists(image_path):
-                try:
-                    os.remove(image_path)
-                except OSError as e:
-                    logger.error(f"无法删除临时文件 {image_path}: {e}")
-            if 'task_id' in locals():
+            # 清理落盘的临时文件（包括被取消的任务）
+            for task in batch:
+                if task is not None and task.image_path and os.path.exists(task.image_path):
+                    try:
+                        os.remove(task.image_path)
+                    except OSError as e:
+                        logger.error(f"无法删除临时文件 {task.image_path}: {e}")
+            for _ in batch:
                 recognition_queue.task_done()
+            stats.busy = False
+            if tasks:
+                stats.batches += 1
+                stats.tasks += len(tasks)
+                stats.busy_seconds += time.monotonic() - started
+
+
+def start_recognition_workers():
+    """按 RECOGNITION_WORKERS 启动识别线程池，返回各 worker 的统计对象。"""
+    all_stats = []
+    core_slices = partition_cores(RECOGNITION_WORKERS)
+    # torch.set_num_threads 作用于整个进程而不是单个线程，只能在启动 worker 之前设置一次；
+    # 取最小的核心切片，避免核心数不能整除时较小切片上的 worker 线程数超过核心数
+    torch.set_num_threads(max(1, min(len(cores) for cores in core_slices)))
+    for worker_id, (cores, (yolo, extractor)) in enumerate(zip(core_slices, WORKER_MODELS)):
+        stats = WorkerStats(worker_id, cores)
+        thread = threading.Thread(target=ai_recognition_worker, args=(stats, yolo, extractor),
+                                  name=f'recognition-worker-{worker_id}', daemon=True)
+        thread.start()
+        all_stats.append(stats)
+    return all_stats
+
+
+WORKER_STATS = []
+
+
+def decode_image(data):
+    """直接从内存中的图片字节解码为 BGR ndarray，无法解码时返回 None。"""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
 
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def create_task(file):
+    """把上传的图片转换为识别任务，返回 (task, 错误信息)。"""
+    filename = secure_filename(file.filename)
+    if SPILL_TO_DISK_BYTES is not None and (request.content_length or 0) > SPILL_TO_DISK_BYTES:
+        temp_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}{os.path.splitext(filename)[1].lower()}")
+        file.save(temp_path)
+        logger.info(f"收到识别请求: {filename}，文件较大，已保存至 {temp_path}")
+        return RecognitionTask(filename, image_path=temp_path, content_hash=hash_file(temp_path)), None
+
+    data = file.read()
+    image = decode_image(data)
+    if image is None:
+        return None, 'Invalid image data'
+    logger.info(f"收到识别请求: {filename}")
+    return RecognitionTask(filename, image=image, content_hash=content_hash(data)), None
+
+
+def wait_for_result(task, deadline):
+    """等待 worker 发布任务结果，超过截止时间则取消任务并返回 None。"""
+    try:
+        return task.future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        task.future.cancel()
+        return None
+
+
+def suggest_name(results):
+    """统计成功匹配 (status == 'matched') 的结果中最常见的猫咪名字。"""
+    matched_cat_names = [res['cat_name'] for res in results if res and res.get('status') == 'matched']
+    most_common = Counter(matched_cat_names).most_common(1)
+    return most_common[0][0] if most_common else None
+
+
 @app.route('/recognize', methods=['POST'])
 def recognize_api():
     """识别猫咪的API端点"""
@@ -221,36 +555,77 @@ def recognize_api():
         if file.filename == '' or not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'Invalid file format or no file selected'}), 400
 
-        filename = secure_filename(file.filename)
-        temp_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}{os.path.splitext(filename)[1].lower()}")
-        file.save(temp_path)
-        logger.info(f"收到识别请求: {filename}，已保存至 {temp_path}")
+        task, error = create_task(file)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        recognition_queue.put(task)
 
-        task_id = str(uuid.uuid4())
-        recognition_queue.put((task_id, temp_path, filename))
+        # 等待识别结果（最多 RECOGNITION_TIMEOUT 秒），worker 发布结果后立即返回
+        result = wait_for_result(task, time.monotonic() + RECOGNITION_TIMEOUT)
+        if result is None:
+            logger.error("识别超时")
+            return jsonify({'success': False, 'error': 'timeout'}), 408
 
-        # 等待识别结果（最多30秒）
-        timeout_seconds = 30
-        for _ in range(timeout_seconds * 10):
-            if task_id in recognition_results:
-                result = recognition_results.pop(task_id)
+        # 检查worker是否出错
+        if result.get('error'):
+            error_msg = result['error']
+            logger.error(f"识别失败: {error_msg}")
+            return jsonify({'success': False, 'error': error_msg}), 500
 
-                # 检查worker是否出错
-                if result.get('error'):
-                    error_msg = result['error']
-                    logger.error(f"识别失败: {error_msg}")
-                    return jsonify({'success': False, 'error': error_msg}), 500
+        logger.info(f"返回识别结果: {result}")
+        return jsonify({'success': True, 'data': result})
 
-                logger.info(f"返回识别结果: {result}")
-                return jsonify({'success': True, 'data': result})
+    except Exception as e:
+        logger.error(f"API /recognize 发生错误: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': 'server_error'}), 500
 
-            time.sleep(0.1)
 
-        logger.error("识别超时")
-        return jsonify({'success': False, 'error': 'timeout'}), 408
+@app.route('/recognize_batch', methods=['POST'])
+def recognize_batch_api():
+    """
+    批量识别API端点：一个 multipart 请求携带多张图片（字段名 images），
+    所有图片一起入队，由 worker 成批推理，按上传顺序返回每张图片的结果和建议的猫咪名字。
+    """
+    try:
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({'success': False, 'error': 'No image files provided'}), 400
+        if len(files) > MAX_BATCH_REQUEST_IMAGES:
+            return jsonify({'success': False, 'error': f'Too many images (max {MAX_BATCH_REQUEST_IMAGES})'}), 400
+
+        entries = []
+        for file in files:
+            if file.filename == '' or not allowed_file(file.filename):
+                entries.append((file.filename, None, 'Invalid file format or no file selected'))
+                continue
+            task, error = create_task(file)
+            entries.append((file.filename, task, error))
+
+        # 一次性全部入队，让 worker 凑成整批
+        for _, task, _ in entries:
+            if task is not None:
+                recognition_queue.put(task)
+
+        deadline = time.monotonic() + RECOGNITION_TIMEOUT
+        results = []
+        for filename, task, error in entries:
+            if task is None:
+                results.append({'filename': filename, 'success': False, 'error': error})
+                continue
+            result = wait_for_result(task, deadline)
+            if result is None:
+                results.append({'filename': filename, 'success': False, 'error': 'timeout'})
+            elif result.get('error'):
+                results.append({'filename': filename, 'success': False, 'error': result['error']})
+            else:
+                results.append({'filename': filename, 'success': True, 'data': result})
+
+        suggested_name = suggest_name([res.get('data') for res in results])
+        logger.info(f"批量识别完成: {len(results)} 张图片，建议名字 {suggested_name}")
+        return jsonify({'success': True, 'results': results, 'suggested_name': suggested_name})
 
     except Exception as e:
-        logger.error(f"API /recognize 发生错误: {e}", exc_info=True)
+        logger.error(f"API /recognize_batch 发生错误: {e}", exc_info=True)
         return jsonify({'success': False, 'error': 'server_error'}), 500
 
 
@@ -262,25 +637,37 @@ def health_check():
 
 @app.route('/status', methods=['GET'])
 def status():
-    return jsonify({'queue_size': recognition_queue.qsize(), 'threshold': SIMILARITY_THRESHOLD})
+    index = GALLERY.current
+    return jsonify({
+        'queue_size': recognition_queue.qsize(),
+        'threshold': SIMILARITY_THRESHOLD,
+        'gallery_vectors': len(index) if index is not None else 0,
+        'gallery_reloads': GALLERY.reload_count,
+        'workers': [stats.to_dict() for stats in WORKER_STATS],
+        'embedding_cache': EMBEDDING_CACHE.stats(),
+    })
 
 
 if __name__ == '__main__':
     print("=" * 60)
     print("🚀 启动全自动AI猫咪识别服务器...")
     print(f"   服务器地址: http://localhost:{SERVER_PORT}")
-    print(f"   API端点: POST /recognize")
+    print(f"   API端点: POST /recognize, POST /recognize_batch")
     print(f"   识别阈值 (Threshold): {SIMILARITY_THRESHOLD}")
     print("=" * 60)
 
-    # 启动AI识别工作线程
-    recognition_thread = threading.Thread(target=ai_recognition_worker, daemon=True)
-    recognition_thread.start()
+    # 启动AI识别工作线程池
+    print(f"   识别 worker 数量: {RECOGNITION_WORKERS}")
+    WORKER_STATS.extend(start_recognition_workers())
+
+    # 启动图库热更新线程
+    GALLERY.start()
 
     try:
         # 推荐在生产环境中使用 waitress 或 gunicorn 代替 app.run
         app.run(host='0.0.0.0', port=SERVER_PORT)
     except KeyboardInterrupt:
         print("\n👋 服务器正在关闭...")
-        recognition_queue.put((None, None, None))  # 发送退出信号
+        for _ in range(RECOGNITION_WORKERS):
+            recognition_queue.put(None)  # 每个 worker 发送一个退出信号
         sys.exit(0)
\ No newline at end of file
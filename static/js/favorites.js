@@ -54,7 +54,12 @@ document.addEventListener('DOMContentLoaded', function() {
         catNameElement.textContent = decodeURIComponent(catName);
 
         const img = document.createElement('img');
-        img.src = favorite.url;
+        // 列表中只加载缩略图，原图在点击放大时才加载
+        img.src = favorite.thumb_url || favorite.url;
+        if (favorite.srcset) {
+            img.srcset = favorite.srcset;
+            img.sizes = GALLERY_IMAGE_SIZES;
+        }
         img.alt = `收藏的猫咪`;
         img.loading = 'lazy';
 
@@ -1,3 +1,6 @@
+// 图库网格中图片的显示宽度，供浏览器从 srcset 中挑选合适的缩略图
+const GALLERY_IMAGE_SIZES = '(max-width: 700px) 100vw, 400px';
+
 // 图片放大模态框功能
 function initImageModal() {
     const modalOverlay = document.getElementById('modal-overlay');
@@ -39,20 +42,18 @@ function initImageModal() {
     // 检查图片是否已收藏
     async function checkIfSaved(imageUrl) {
         try {
-            const response = await fetch('/api/favorites');
-            const data = await response.json();
+            const status = await fetchFavoriteStatus([imageUrl]);
+            // 等待期间可能已经切换到另一张图片
+            if (imageUrl !== currentImageUrl) return;
             
-            if (data.success) {
-                const isSaved = data.favorites.some(fav => fav.url === imageUrl);
-                if (isSaved) {
-                    modalSaveBtn.classList.add('saved');
-                    modalSaveBtn.innerHTML = '✅ 已收藏';
-                    modalSaveBtn.disabled = true;
-                } else {
-                    modalSaveBtn.classList.remove('saved');
-                    modalSaveBtn.innerHTML = '💖 保存到收藏';
-                    modalSaveBtn.disabled = false;
-                }
+            if (status[imageUrl]) {
+                modalSaveBtn.classList.add('saved');
+                modalSaveBtn.innerHTML = '✅ 已收藏';
+                modalSaveBtn.disabled = true;
+            } else {
+                modalSaveBtn.classList.remove('saved');
+                modalSaveBtn.innerHTML = '💖 保存到收藏';
+                modalSaveBtn.disabled = false;
             }
         } catch (error) {
             console.error('检查收藏状态失败:', error);
@@ -113,6 +114,20 @@ function initImageModal() {
     return openModal;
 }
 
+// 批量查询图片的收藏状态，返回 { 图片URL: 是否已收藏 }
+async function fetchFavoriteStatus(imageUrls) {
+    const response = await fetch('/api/favorites/status', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ image_urls: imageUrls })
+    });
+    const data = await response.json();
+    if (!data.success) {
+        throw new Error(data.error || '查询收藏状态失败');
+    }
+    return data.status;
+}
+
 // 为图片元素添加点击放大功能
 function addImageClickHandler(imgElement, imageUrl) {
     if (!imgElement || !imageUrl) return;
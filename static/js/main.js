@@ -25,6 +25,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const cancelUploadBtn = document.getElementById('cancel-upload-btn');
     const cancelUploadBtnProgress = document.getElementById('cancel-upload-btn-progress');
     const recognizeBtn = document.getElementById('recognize-btn');
+    const recognitionResults = document.getElementById('recognition-results');
 
 
     let isLoading = false;
@@ -40,17 +41,19 @@ document.addEventListener('DOMContentLoaded', function() {
         loading.style.display = 'block';
 
         try {
-            const response = await fetch(`/api/cats?count=${limit}`);
+            const response = await fetch(`/api/cats?count=${limit}&no_repeat=1`);
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             const data = await response.json();
 
             if (data.success && data.cats.length > 0) {
+                const saveButtons = [];
                 data.cats.forEach(cat => {
-                    const galleryItem = createGalleryItem(cat);
+                    const galleryItem = createGalleryItem(cat, saveButtons);
                     gallery.appendChild(galleryItem);
                 });
+                checkIfSaved(saveButtons);
                 page++;
             } else {
                 loading.textContent = '没有更多猫咪了';
@@ -67,7 +70,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // 创建图库项目
-    function createGalleryItem(cat) {
+    function createGalleryItem(cat, saveButtons) {
         const item = document.createElement('div');
         item.className = 'gallery-item';
 
@@ -76,7 +79,12 @@ document.addEventListener('DOMContentLoaded', function() {
         catName.textContent = cat.name;
 
         const img = document.createElement('img');
-        img.src = cat.url;
+        // 列表中只加载缩略图，原图在点击放大时才加载
+        img.src = cat.thumb_url || cat.url;
+        if (cat.srcset) {
+            img.srcset = cat.srcset;
+            img.sizes = GALLERY_IMAGE_SIZES;
+        }
         img.alt = `一只名叫 ${cat.name} 的猫`;
         img.loading = 'lazy';
 
@@ -92,8 +100,8 @@ document.addEventListener('DOMContentLoaded', function() {
             saveCat(cat.url, saveBtn);
         };
 
-        // 检查是否已经收藏
-        checkIfSaved(cat.url, saveBtn);
+        // 收藏状态在整页渲染后批量查询
+        saveButtons.push({ url: cat.url, button: saveBtn });
 
         actions.appendChild(saveBtn);
         item.appendChild(catName);
@@ -106,15 +114,13 @@ document.addEventListener('DOMContentLoaded', function() {
         return item;
     }
 
-    // 检查图片是否已收藏
-    async function checkIfSaved(imageUrl, button) {
+    // 批量检查本页图片是否已收藏
+    async function checkIfSaved(entries) {
+        if (entries.length === 0) return;
         try {
-            const response = await fetch('/api/favorites');
-            const data = await response.json();
-            
-            if (data.success) {
-                const isSaved = data.favorites.some(fav => fav.url === imageUrl);
-                if (isSaved) {
+            const status = await fetchFavoriteStatus(entries.map(entry => entry.url));
+            entries.forEach(({ url, button }) => {
+                if (status[url]) {
                     button.classList.add('saved');
                     button.innerHTML = '✅ 已收藏';
                     button.disabled = true;
@@ -123,7 +129,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     button.innerHTML = '❤️ 喜欢';
                     button.disabled = false;
                 }
-            }
+            });
         } catch (error) {
             console.error('检查收藏状态失败:', error);
         }
@@ -230,7 +236,14 @@ document.addEventListener('DOMContentLoaded', function() {
                     if (xhr.status === 200) {
                         const data = JSON.parse(xhr.responseText);
                         if (data.success) {
-                            showNotification(`成功上传 ${data.uploaded_count} 张图片！`);
+                            let message = `成功上传 ${data.uploaded_count} 张图片！`;
+                            if (data.reused_count > 0) {
+                                message += ` 其中 ${data.reused_count} 张与已有图片内容相同，共用已有文件`;
+                            }
+                            if (data.duplicate_count > 0) {
+                                message += ` ${data.duplicate_count} 张已在该猫咪名下，未重复保存`;
+                            }
+                            showNotification(message);
                             resetUploadForm();
                             // 隐藏上传区域，显示图库
                             document.getElementById('upload-section').style.display = 'none';
@@ -267,7 +280,7 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // 识别按钮处理
+    // 识别按钮处理：创建异步识别任务，通过 SSE 逐张显示结果
     if(recognizeBtn) {
         recognizeBtn.addEventListener('click', async () => {
             if (!fileInput.files.length) {
@@ -283,79 +296,26 @@ document.addEventListener('DOMContentLoaded', function() {
             // 禁用识别按钮并显示加载状态
             recognizeBtn.disabled = true;
             recognizeBtn.innerHTML = '🔄 识别中...';
+            recognitionResults.innerHTML = '';
+            recognitionResults.style.display = 'block';
             
             try {
-                const response = await fetch('/api/recognize_cats', {
+                const response = await fetch('/api/recognize_jobs', {
                     method: 'POST',
                     body: formData
                 });
                 
-                const data = await response.json();
+                const job = await response.json();
                 
-                if (data.success) {
-                    // 识别成功，填充猫咪名字到文本框
-                    const suggestedName = data.suggested_name;
-                    if (suggestedName && catNameInput) {
-                        catNameInput.value = suggestedName;
-                        catNameInput.focus();
-                        
-                        // 高亮显示文本框，提示用户注意
-                        catNameInput.style.backgroundColor = '#fffacd';
-                        catNameInput.style.border = '2px solid #ffd700';
-                        
-                        // 3秒后恢复正常样式
-                        setTimeout(() => {
-                            catNameInput.style.backgroundColor = '';
-                            catNameInput.style.border = '';
-                        }, 3000);
-                    }
-                    
-                    // 显示识别结果
-                    let message = `✨ 识别成功！建议猫咪名字：${suggestedName}<br>`;
-                    message += `📊 识别了 ${data.recognized_count} 张图片<br>`;
-                    
-                    if (data.recognition_results && data.recognition_results.length > 0) {
-                        message += '<br>📋 详细识别结果：<br>';
-                        data.recognition_results.forEach(result => {
-                            message += `📷 ${result.filename} → 🐱 ${result.cat_name}<br>`;
-                        });
-                    }
-                    
-                    if (data.failed_count > 0) {
-                        message += `<br>⚠️ ${data.failed_count} 张图片识别失败`;
-                    }
-                    
-                    message += '<br><br>💡 请确认猫咪名字后点击"上传图片"按钮完成上传';
-                    
-                    showNotification(message, 'success');
-                    
+                if (job.success) {
+                    await streamRecognitionJob(job.job_id);
                 } else {
-                    // 识别失败
-                    let errorMessage = '识别失败：';
-                    if (data.failed_files && data.failed_files.length > 0) {
-                        data.failed_files.forEach(file => {
-                            if (file.error === 'Recognition failed') {
-                                errorMessage += `<br>📷 ${file.filename} → ❌ 未识别`;
-                            } else {
-                                errorMessage += `<br>📷 ${file.filename} → ❌ ${file.error}`;
-                            }
-                        });
-                    } else {
-                        errorMessage += data.error || '未知错误';
-                    }
-                    
-                    errorMessage += '<br><br>💡 请手动输入猫咪名字后点击"上传图片"按钮';
-                    
-                    showNotification(errorMessage, 'error');
+                    showNotification(`识别失败：${job.error || '未知错误'}<br><br>💡 请手动输入猫咪名字后点击"上传图片"按钮`, 'error');
                 }
                 
             } catch (error) {
                 console.error('识别时出错:', error);
-                if (error.name === 'AbortError') {
-                    showNotification('识别已取消');
-                } else {
-                    showNotification('识别服务不可用，请稍后再试', 'error');
-                }
+                showNotification('识别服务不可用，请稍后再试', 'error');
             } finally {
                 // 恢复按钮状态
                 recognizeBtn.disabled = false;
@@ -363,6 +323,73 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     }
+
+    // 订阅识别任务的结果流，直到收到 done 事件
+    function streamRecognitionJob(jobId) {
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`/api/recognize_jobs/${jobId}/events`);
+            source.addEventListener('result', (event) => {
+                renderRecognitionResult(JSON.parse(event.data));
+            });
+            source.addEventListener('done', (event) => {
+                source.close();
+                handleRecognitionDone(JSON.parse(event.data));
+                resolve();
+            });
+            source.onerror = () => {
+                source.close();
+                reject(new Error('识别结果连接中断'));
+            };
+        });
+    }
+
+    // 显示单张图片的识别结果
+    function renderRecognitionResult(result) {
+        const line = document.createElement('div');
+        line.className = result.success ? 'recognition-result' : 'recognition-result failed';
+        if (result.success) {
+            line.textContent = `📷 ${result.filename} → 🐱 ${result.cat_name}`;
+        } else if (result.error === 'Recognition failed') {
+            line.textContent = `📷 ${result.filename} → ❌ 未识别`;
+        } else {
+            line.textContent = `📷 ${result.filename} → ❌ ${result.error}`;
+        }
+        recognitionResults.appendChild(line);
+    }
+
+    // 所有图片识别完成后，填充建议的猫咪名字
+    function handleRecognitionDone(summary) {
+        if (summary.recognized_count === 0) {
+            showNotification('识别失败：没有图片被成功识别<br><br>💡 请手动输入猫咪名字后点击"上传图片"按钮', 'error');
+            return;
+        }
+
+        // 识别成功，填充猫咪名字到文本框
+        const suggestedName = summary.suggested_name;
+        if (suggestedName && catNameInput) {
+            catNameInput.value = suggestedName;
+            catNameInput.focus();
+            
+            // 高亮显示文本框，提示用户注意
+            catNameInput.style.backgroundColor = '#fffacd';
+            catNameInput.style.border = '2px solid #ffd700';
+            
+            // 3秒后恢复正常样式
+            setTimeout(() => {
+                catNameInput.style.backgroundColor = '';
+                catNameInput.style.border = '';
+            }, 3000);
+        }
+        
+        let message = `✨ 识别成功！建议猫咪名字：${suggestedName}<br>`;
+        message += `📊 识别了 ${summary.recognized_count} 张图片<br>`;
+        if (summary.failed_count > 0) {
+            message += `<br>⚠️ ${summary.failed_count} 张图片识别失败`;
+        }
+        message += '<br><br>💡 请确认猫咪名字后点击"上传图片"按钮完成上传';
+        
+        showNotification(message, 'success');
+    }
     
     // 取消上传
     function cancelUpload() {
@@ -384,6 +411,8 @@ document.addEventListener('DOMContentLoaded', function() {
         if(uploadForm) uploadForm.reset();
         previewContainer.innerHTML = '';
         previewContainer.style.display = 'none';
+        recognitionResults.innerHTML = '';
+        recognitionResults.style.display = 'none';
         uploadProgressBar.style.width = '0%';
         uploadProgress.style.display = 'none';
     }
@@ -6,27 +6,43 @@ document.addEventListener('DOMContentLoaded', function() {
     const loading = document.getElementById('loading');
 
     let isLoading = false;
+    let nextCursor = null;
+    let noMoreCats = false;
+    const limit = 30;
 
-    // 加载最近上传的猫咪
+    // 分页加载最近上传的猫咪
     async function loadRecentCats() {
-        if (isLoading) return;
+        if (isLoading || noMoreCats) return;
         isLoading = true;
         loading.style.display = 'block';
 
         try {
-            const response = await fetch('/api/source_cats');
+            let url = `/api/source_cats?limit=${limit}`;
+            if (nextCursor) {
+                url += `&cursor=${encodeURIComponent(nextCursor)}`;
+            }
+            const response = await fetch(url);
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             const data = await response.json();
 
-            if (data.success && data.cats.length > 0) {
+            if (data.success) {
+                const saveButtons = [];
                 data.cats.forEach(cat => {
-                    const galleryItem = createGalleryItem(cat);
+                    const galleryItem = createGalleryItem(cat, saveButtons);
                     gallery.appendChild(galleryItem);
                 });
-            } else if (data.cats.length === 0) {
-                loading.textContent = '没有更多猫咪了';
+                checkIfSaved(saveButtons);
+                nextCursor = data.next_cursor;
+                if (!nextCursor) {
+                    noMoreCats = true;
+                    loading.textContent = '没有更多猫咪了';
+                    window.removeEventListener('scroll', handleScroll);
+                } else if (document.body.offsetHeight <= window.innerHeight) {
+                    // 第一页不足一屏时没有滚动事件，继续加载下一页
+                    setTimeout(loadRecentCats, 0);
+                }
             } else {
                 loading.textContent = '加载失败，请稍后重试';
             }
@@ -35,13 +51,20 @@ document.addEventListener('DOMContentLoaded', function() {
             loading.textContent = '加载出错';
         } finally {
             isLoading = false;
-            // 在此场景下，我们一次性加载所有，所以直接隐藏加载指示器
-            loading.style.display = 'none';
+            // 全部加载完后保留"没有更多"提示
+            loading.style.display = noMoreCats ? 'block' : 'none';
+        }
+    }
+
+    // 滚动到底部附近时加载下一页
+    function handleScroll() {
+        if (window.innerHeight + window.scrollY >= document.body.offsetHeight - 500) {
+            loadRecentCats();
         }
     }
 
     // 创建图库项目
-    function createGalleryItem(cat) {
+    function createGalleryItem(cat, saveButtons) {
         const item = document.createElement('div');
         item.className = 'gallery-item';
 
@@ -50,7 +73,12 @@ document.addEventListener('DOMContentLoaded', function() {
         catName.textContent = cat.name;
 
         const img = document.createElement('img');
-        img.src = cat.url;
+        // 列表中只加载缩略图，原图在点击放大时才加载
+        img.src = cat.thumb_url || cat.url;
+        if (cat.srcset) {
+            img.srcset = cat.srcset;
+            img.sizes = GALLERY_IMAGE_SIZES;
+        }
         img.alt = `一只名叫 ${cat.name} 的猫`;
         img.loading = 'lazy';
 
@@ -63,8 +91,8 @@ document.addEventListener('DOMContentLoaded', function() {
         saveBtn.title = '收藏';
         saveBtn.onclick = () => saveCat(cat.url, saveBtn);
 
-        // 检查是否已经收藏
-        checkIfSaved(cat.url, saveBtn);
+        // 收藏状态在整页渲染后批量查询
+        saveButtons.push({ url: cat.url, button: saveBtn });
 
         actions.appendChild(saveBtn);
         item.appendChild(catName);
@@ -77,15 +105,13 @@ document.addEventListener('DOMContentLoaded', function() {
         return item;
     }
 
-    // 检查图片是否已收藏
-    async function checkIfSaved(imageUrl, button) {
+    // 批量检查本页图片是否已收藏
+    async function checkIfSaved(entries) {
+        if (entries.length === 0) return;
         try {
-            const response = await fetch('/api/favorites');
-            const data = await response.json();
-            
-            if (data.success) {
-                const isSaved = data.favorites.some(fav => fav.url === imageUrl);
-                if (isSaved) {
+            const status = await fetchFavoriteStatus(entries.map(entry => entry.url));
+            entries.forEach(({ url, button }) => {
+                if (status[url]) {
                     button.classList.add('saved');
                     button.innerHTML = '✅ 已收藏';
                     button.disabled = true;
@@ -94,7 +120,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     button.innerHTML = '❤️ 喜欢';
                     button.disabled = false;
                 }
-            }
+            });
         } catch (error) {
             console.error('检查收藏状态失败:', error);
         }
@@ -140,5 +166,6 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // 初始加载
+    window.addEventListener('scroll', handleScroll);
     loadRecentCats();
 });
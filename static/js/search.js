@@ -7,6 +7,12 @@ document.addEventListener('DOMContentLoaded', function() {
     const searchResults = document.getElementById('search-results');
     const searchMessage = document.getElementById('search-message');
 
+    const limit = 30;
+    let currentQuery = '';
+    let offset = 0;
+    let hasMore = false;
+    let isLoading = false;
+
     // 执行搜索
     async function performSearch() {
         const query = searchInput.value.trim();
@@ -14,28 +20,48 @@ document.addEventListener('DOMContentLoaded', function() {
             searchMessage.textContent = '请输入要搜索的名字。';
             searchMessage.className = 'message-indicator info';
             searchResults.innerHTML = '';
+            hasMore = false;
             return;
         }
 
+        currentQuery = query;
+        offset = 0;
+        hasMore = false;
         searchMessage.textContent = '正在搜索...';
         searchMessage.className = 'message-indicator info';
         searchResults.innerHTML = '';
 
+        await loadSearchPage(true);
+    }
+
+    // 加载当前搜索的下一页结果
+    async function loadSearchPage(isNewSearch = false) {
+        if (isLoading && !isNewSearch) return;
+        isLoading = true;
+        const query = currentQuery;
+
         try {
-            const response = await fetch(`/api/search_cats?q=${encodeURIComponent(query)}`);
+            const response = await fetch(`/api/search_cats?q=${encodeURIComponent(query)}&limit=${limit}&offset=${offset}`);
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             const data = await response.json();
 
-            if (data.success && data.cats.length > 0) {
-                searchMessage.textContent = `🎉 找到了 ${data.count} 张图片。`;
+            // 等待期间用户发起了新的搜索，丢弃旧结果
+            if (query !== currentQuery) return;
+
+            if (data.success && data.total > 0) {
+                searchMessage.textContent = `🎉 找到了 ${data.total} 张图片。`;
                 searchMessage.className = 'message-indicator success';
+                const saveButtons = [];
                 data.cats.forEach(cat => {
-                    const galleryItem = createGalleryItem(cat);
+                    const galleryItem = createGalleryItem(cat, saveButtons);
                     searchResults.appendChild(galleryItem);
                 });
-            } else if (data.cats.length === 0) {
+                checkIfSaved(saveButtons);
+                offset += data.count;
+                hasMore = data.has_more;
+            } else if (data.success) {
                 searchMessage.textContent = '😿 没有找到符合条件的猫咪。';
                 searchMessage.className = 'message-indicator info';
             } else {
@@ -46,11 +72,22 @@ document.addEventListener('DOMContentLoaded', function() {
             console.error('搜索时出错:', error);
             searchMessage.textContent = '😿 搜索时发生网络错误。';
             searchMessage.className = 'message-indicator error';
+        } finally {
+            if (query === currentQuery) {
+                isLoading = false;
+            }
+        }
+    }
+
+    // 滚动到底部附近时加载更多结果
+    function handleScroll() {
+        if (hasMore && window.innerHeight + window.scrollY >= document.body.offsetHeight - 500) {
+            loadSearchPage();
         }
     }
 
     // 创建图库项目
-    function createGalleryItem(cat) {
+    function createGalleryItem(cat, saveButtons) {
         const item = document.createElement('div');
         item.className = 'gallery-item';
 
@@ -59,7 +96,12 @@ document.addEventListener('DOMContentLoaded', function() {
         catName.textContent = cat.name;
 
         const img = document.createElement('img');
-        img.src = cat.url;
+        // 列表中只加载缩略图，原图在点击放大时才加载
+        img.src = cat.thumb_url || cat.url;
+        if (cat.srcset) {
+            img.srcset = cat.srcset;
+            img.sizes = GALLERY_IMAGE_SIZES;
+        }
         img.alt = `一只名叫 ${cat.name} 的猫`;
         img.loading = 'lazy';
 
@@ -72,8 +114,8 @@ document.addEventListener('DOMContentLoaded', function() {
         saveBtn.title = '收藏';
         saveBtn.onclick = () => saveCat(cat.url, saveBtn);
 
-        // 检查是否已经收藏
-        checkIfSaved(cat.url, saveBtn);
+        // 收藏状态在整页渲染后批量查询
+        saveButtons.push({ url: cat.url, button: saveBtn });
 
         actions.appendChild(saveBtn);
         item.appendChild(catName);
@@ -86,15 +128,13 @@ document.addEventListener('DOMContentLoaded', function() {
         return item;
     }
 
-    // 检查图片是否已收藏
-    async function checkIfSaved(imageUrl, button) {
+    // 批量检查本页图片是否已收藏
+    async function checkIfSaved(entries) {
+        if (entries.length === 0) return;
         try {
-            const response = await fetch('/api/favorites');
-            const data = await response.json();
-            
-            if (data.success) {
-                const isSaved = data.favorites.some(fav => fav.url === imageUrl);
-                if (isSaved) {
+            const status = await fetchFavoriteStatus(entries.map(entry => entry.url));
+            entries.forEach(({ url, button }) => {
+                if (status[url]) {
                     button.classList.add('saved');
                     button.innerHTML = '✅ 已收藏';
                     button.disabled = true;
@@ -103,7 +143,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     button.innerHTML = '❤️ 喜欢';
                     button.disabled = false;
                 }
-            }
+            });
         } catch (error) {
             console.error('检查收藏状态失败:', error);
         }
@@ -149,6 +189,7 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     // 事件监听
+    window.addEventListener('scroll', handleScroll);
     searchButton.addEventListener('click', performSearch);
     searchInput.addEventListener('keypress', function(event) {
         if (event.key === 'Enter') {
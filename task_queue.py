@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+基于 SQLite 的本地持久化任务队列。
+任务写入数据库后由后台线程池执行，进程重启不会丢失；
+失败的任务按指数退避重试，超过次数后标记为 failed，可随时查询状态。
+处理函数必须是幂等的：任务可能因为重试或租约过期而被执行不止一次。
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TASK_STATUSES = ('pending', 'running', 'done', 'failed')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_type TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        dedupe_key TEXT UNIQUE,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        last_error TEXT,
+        run_at REAL NOT NULL,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_tasks_status_run_at ON tasks (status, run_at);
+'''
+
+
+class TaskQueue:
+    """
+    SQLite 任务队列和执行它的工作线程池。
+    register() 注册任务类型的处理函数 handler(payload)，enqueue() 写入任务，start() 启动线程。
+    多个进程可以共用同一个数据库：领取任务在 BEGIN IMMEDIATE 事务中完成，不会重复领取；
+    running 状态超过 lease 秒没有结束的任务（如进程崩溃）会被重新领取。
+    """
+
+    def __init__(self, db_path, workers=2, max_attempts=3, retry_delay=5.0,
+                 poll_interval=2.0, lease=600):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.handlers = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()  # start()/stop() 可能被多个请求线程同时调用
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._conn = self._connect()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False,
+                               isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def register(self, task_type, handler):
+        self.handlers[task_type] = handler
+
+    def enqueue(self, task_type, payload, dedupe_key=None, max_attempts=None):
+        """
+        写入一个任务并唤醒工作线程，返回任务 id。
+        dedupe_key 相同的任务只会存在一个：已有任务尚未结束时直接返回它的 id；
+        已是 done/failed 时用新的 payload 重置为 pending 重新执行。
+        """
+        if task_type not in self.handlers:
+            raise ValueError(f"未注册的任务类型: {task_type}")
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'INSERT OR IGNORE INTO tasks (task_type, payload, dedupe_key, max_attempts, '
+                'run_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (task_type, json.dumps(payload), dedupe_key,
+                 max_attempts or self.max_attempts, now, now, now)
+            )
+            if cursor.rowcount:
+                task_id = cursor.lastrowid
+            else:
+                self._conn.execute(
+                    "UPDATE tasks SET task_type = ?, payload = ?, status = 'pending', attempts = 0, "
+                    "max_attempts = ?, last_error = NULL, run_at = ?, updated_at = ? "
+                    "WHERE dedupe_key = ? AND status IN ('done', 'failed')",
+                    (task_type, json.dumps(payload), max_attempts or self.max_attempts, now, now, dedupe_key)
+                )
+                task_id = self._conn.execute(
+                    'SELECT id FROM tasks WHERE dedupe_key = ?', (dedupe_key,)
+                ).fetchone()['id']
+        self._wakeup.set()
+        return task_id
+
+    def get(self, task_id):
+        """返回任务状态字典，任务不存在时返回 None。"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row['id'],
+            'type': row['task_type'],
+            'payload': json.loads(row['payload']),
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'max_attempts': row['max_attempts'],
+            'last_error': row['last_error'],
+            'run_at': row['run_at'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+
+    def stats(self):
+        """各状态的任务数量。"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT status, COUNT(*) AS n FROM tasks GROUP BY status'
+            ).fetchall()
+        counts = dict.fromkeys(TASK_STATUSES, 0)
+        counts.update({row['status']: row['n'] for row in rows})
+        return counts
+
+    def retry_failed(self):
+        """把所有 failed 任务重新放回队列，返回数量。"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE tasks SET status = 'pending', attempts = 0, run_at = ?, updated_at = ? "
+                "WHERE status = 'failed'", (now, now)
+            )
+        self._wakeup.set()
+        return cursor.rowcount
+
+    def _claim(self, conn):
+        """领取一个到期的任务并标记为 running；没有可执行的任务时返回 None。"""
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE (status = 'pending' AND run_at <= ?) "
+                "OR (status = 'running' AND updated_at < ?) ORDER BY run_at, id LIMIT 1",
+                (now, now - self.lease)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE tasks SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ?", (now, row['id'])
+                )
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        return row
+
+    def _finish(self, conn, row, error=None):
+        now = time.time()
+        attempts = row['attempts'] + 1
+        if error is None:
+            conn.execute(
+                "UPDATE tasks SET status = 'done', last_error = NULL, updated_at = ? WHERE id = ?",
+                (now, row['id'])
+            )
+        elif attempts < row['max_attempts']:
+            delay = self.retry_delay * (2 ** (attempts - 1))
+            conn.execute(
+                "UPDATE tasks SET status = 'pending', last_error = ?, run_at = ?, updated_at = ? "
+                "WHERE id = ?", (error, now + delay, now, row['id'])
+            )
+            logger.warning(f"任务 {row['id']} ({row['task_type']}) 第 {attempts} 次执行失败，"
+                           f"{delay:.0f} 秒后重试: {error}")
+        else:
+            conn.execute(
+                "UPDATE tasks SET status = 'failed', last_error = ?, updated_at = ? WHERE id = ?",
+                (error, now, row['id'])
+            )
+            logger.error(f"任务 {row['id']} ({row['task_type']}) 已失败 {attempts} 次，不再重试: {error}")
+
+    def _run_worker(self):
+        conn = self._connect()
+        while not self._stop_event.is_set():
+            try:
+                row = self._claim(conn)
+            except sqlite3.Error as e:
+                logger.error(f"领取任务失败: {e}")
+                row = None
+            if row is None:
+                # 没有任务时等待入队通知或轮询间隔（其他进程写入的任务靠轮询发现）
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            handler = self.handlers.get(row['task_type'])
+            error = None
+            try:
+                if handler is None:
+                    raise LookupError(f"未注册的任务类型: {row['task_type']}")
+                handler(json.loads(row['payload']))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            try:
+                self._finish(conn, row, error)
+            except sqlite3.Error as e:
+                logger.error(f"更新任务 {row['id']} 状态失败: {e}")
+        conn.close()
+
+    def start(self):
+        """启动工作线程；已启动时不做任何事（可从多个线程同时调用）。"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stop_event.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run_worker, daemon=True, name=f"task-worker-{i}")
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"后台任务队列已启动: {self.workers} 个工作线程, 数据库 {self.db_path}")
+
+    def stop(self, timeout=5):
+        with self._start_lock:
+            self._stop_event.set()
+            self._wakeup.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []